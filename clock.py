@@ -0,0 +1,75 @@
+"""
+The bot's notion of "now".
+
+Season, weather, water and scheduling code asks this module for the
+time instead of calling time.time() or datetime.utcnow() directly, so a
+simulation can swap in a VirtualClock and run weeks of game time in
+seconds. Durations that measure real work (latency metrics, timeouts,
+rate limits) keep using time.monotonic().
+"""
+import asyncio
+import datetime
+import time as _time
+
+class Clock:
+    """Wall-clock time."""
+    def time(self):
+        return _time.time()
+
+    def utcnow(self):
+        return datetime.datetime.utcnow()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+class VirtualClock(Clock):
+    """
+    Time that only moves when told to. sleep() advances the clock by the
+    requested amount and returns at once.
+    """
+    def __init__(self, start):
+        if isinstance(start, datetime.datetime):
+            start = start.replace(tzinfo=datetime.timezone.utc).timestamp()
+        self.now = float(start)
+
+    def time(self):
+        return self.now
+
+    def utcnow(self):
+        return datetime.datetime.fromtimestamp(self.now, datetime.timezone.utc).replace(tzinfo=None)
+
+    def set(self, timestamp):
+        if timestamp < self.now:
+            raise ValueError("A virtual clock cannot go backwards.")
+        self.now = float(timestamp)
+
+    def advance(self, seconds):
+        self.set(self.now + seconds)
+
+    async def sleep(self, seconds):
+        self.advance(max(0.0, seconds))
+        await asyncio.sleep(0)
+
+_clock = Clock()
+
+def use(new_clock):
+    """
+    Installs the clock every caller of this module sees. Returns the old one.
+    """
+    global _clock
+    old, _clock = _clock, new_clock
+    return old
+
+def current():
+    return _clock
+
+def time():
+    """Unix time in seconds."""
+    return _clock.time()
+
+def utcnow():
+    """Naive UTC datetime, like datetime.datetime.utcnow()."""
+    return _clock.utcnow()
+
+async def sleep(seconds):
+    await _clock.sleep(seconds)
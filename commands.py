@@ -1,34 +1,69 @@
 from discord.ext import commands
 from discord import app_commands, Interaction
 import discord
+import asyncio
 import datetime
+import io
+import clock
 from storage import (
-    get_last_season, get_last_weather,
-    set_pause_state, get_pause_state
+    get_last_weather, set_pause_state,
+    get_weather_history, get_weather_counts, get_season_history,
+    get_water_totals, get_command_counts, get_command_rejections
 )
 from logger import log_to_discord
+from weather_manager import get_forecast, WEATHER_EMOJI, WEATHER_INTERVAL
+from scheduler import scheduler
+from season_manager import current_season
+from loop_monitor import monitor, top_functions, format_slow_callbacks
+from events import bus, PauseToggled, SeasonChanged, WeatherChanged
+
+PAUSE_DURATION = 4 * 60 * 60  # seconds
 
 class SeasonCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        scheduler.register_handler("resume_weather", self.auto_resume)
+
+        # /seasoninfo embed, rebuilt only when the season or weather changes
+        self._season_embed = None
+        self._season_embed_end = None
+        bus.subscribe(SeasonChanged, self.invalidate_season_embed)
+        bus.subscribe(WeatherChanged, self.invalidate_season_embed)
+
+    def invalidate_season_embed(self, event=None):
+        self._season_embed = None
+
+    async def auto_resume(self, payload=None):
+        """
+        Scheduler deadline set by /pauseweather; persisted, so a pause
+        still expires on time across restarts.
+        """
+        set_pause_state(False)
+        bus.publish(PauseToggled(paused=False))
+        await log_to_discord(self.bot, "Weather auto-resumed after 4-hour pause.")
 
     @app_commands.command(name="seasoninfo", description="Show current season and weather")
     async def season_info(self, interaction: Interaction):
         """
         Displays the current season, when it started, when it ends, 
         and the current weather (if known).
+        The embed is cached; Discord renders the relative end time
+        client-side, so it stays correct without rebuilding.
         """
-        season_data = get_last_season()
-        weather = get_last_weather() or "Unknown"
+        if self._season_embed is None or clock.utcnow() >= self._season_embed_end:
+            self._season_embed, self._season_embed_end = self.build_season_embed()
+        await interaction.response.send_message(embed=self._season_embed)
 
-        if not season_data:
-            await interaction.response.send_message("No season data available yet.", ephemeral=True)
-            return
+    def build_season_embed(self):
+        """
+        Returns (embed, season end).
+        """
+        season_data = current_season()
+        weather = get_last_weather() or "Unknown"
 
-        season = season_data.get("season")
-        start_str = season_data.get("start")
-        start_dt = datetime.datetime.fromisoformat(start_str)
-        end_dt = start_dt + datetime.timedelta(days=14)
+        season = season_data["season"]
+        start_dt = datetime.datetime.fromisoformat(season_data["start"])
+        end_dt = datetime.datetime.fromisoformat(season_data["end"])
 
         start_fmt = discord.utils.format_dt(start_dt, style='F')
         end_fmt = discord.utils.format_dt(end_dt, style='F')
@@ -43,7 +78,111 @@ class SeasonCommands(commands.Cog):
             ),
             color=discord.Color.blurple()
         )
+        return embed, end_dt
+
+    @app_commands.command(name="forecast", description="Show the planned weather for the coming hours")
+    @app_commands.describe(hours="How many hours ahead to show")
+    async def forecast(self, interaction: Interaction, hours: app_commands.Range[int, 1, 12] = 3):
+        """
+        Shows the upcoming weather from the season's pre-generated plan,
+        merging consecutive ticks with the same weather into one line.
+        """
+        ticks = hours * 60 * 60 // WEATHER_INTERVAL
+        entries = get_forecast(clock.utcnow(), ticks)
+        if not entries:
+            await interaction.response.send_message("No forecast available yet.", ephemeral=True)
+            return
+
+        interval = datetime.timedelta(seconds=WEATHER_INTERVAL)
+        runs = []
+        for tick_start, weather in entries:
+            if runs and runs[-1][2] == weather:
+                runs[-1][1] = tick_start + interval
+            else:
+                runs.append([tick_start, tick_start + interval, weather])
 
+        lines = [
+            f"{discord.utils.format_dt(start, style='t')} - {discord.utils.format_dt(end, style='t')}: "
+            f"{WEATHER_EMOJI.get(weather, '')} {weather}"
+            for start, end, weather in runs
+        ]
+        embed = discord.Embed(
+            title=f"Weather Forecast (next {hours}h)",
+            description="\n".join(lines),
+            color=discord.Color.blurple()
+        )
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="weatherhistory", description="Show the weather of the past hours")
+    @app_commands.describe(hours="How many hours back to show")
+    async def weather_history(self, interaction: Interaction, hours: app_commands.Range[int, 1, 72] = 24):
+        """
+        Shows how often each weather occurred in the window and the most
+        recent changes, merging repeats of the same weather.
+        """
+        since = clock.time() - hours * 60 * 60
+        rows = get_weather_history(since)
+        if not rows:
+            await interaction.response.send_message(f"No weather recorded in the last {hours}h.", ephemeral=True)
+            return
+
+        counts = {}
+        changes = []
+        for ts, weather, _ in rows:
+            counts[weather] = counts.get(weather, 0) + 1
+            if not changes or changes[-1][1] != weather:
+                changes.append((ts, weather))
+
+        summary = ", ".join(
+            f"{WEATHER_EMOJI.get(weather, '')} {weather} {count / len(rows):.0%}"
+            for weather, count in sorted(counts.items(), key=lambda item: -item[1])
+        )
+        recent = [
+            f"<t:{int(ts)}:t> {WEATHER_EMOJI.get(weather, '')} {weather}"
+            for ts, weather in changes[-15:]
+        ]
+        embed = discord.Embed(
+            title=f"Weather History (last {hours}h)",
+            description=f"{summary}\n\n" + "\n".join(recent),
+            color=discord.Color.blurple()
+        )
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="seasonstats", description="Show statistics for the current season")
+    async def season_stats(self, interaction: Interaction):
+        """
+        Weather mix, water updates and in-game commands since the current
+        season started, plus the most recent season changes.
+        """
+        season_data = current_season()
+        start = datetime.datetime.fromisoformat(season_data["start"])
+        since = start.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+        weather_counts = get_weather_counts(since)
+        total = sum(weather_counts.values())
+        weather_lines = [
+            f"{WEATHER_EMOJI.get(weather, '')} {weather}: {count} ({count / total:.0%})"
+            for weather, count in weather_counts.items()
+        ] or ["Nothing recorded yet"]
+
+        runs, sent, failed = get_water_totals(since)
+        command_counts = get_command_counts(since)
+        top_commands = ", ".join(f"!{command} x{count}" for command, count in list(command_counts.items())[:5])
+        rejections = get_command_rejections(since)
+        rejected = ", ".join(f"{outcome.replace('_', ' ')} x{count}" for outcome, count in rejections.items())
+
+        seasons = [f"<t:{int(ts)}:d> {season}" for ts, season, _ in get_season_history(5)]
+
+        embed = discord.Embed(title=f"{season_data['season']} so far", color=discord.Color.blurple())
+        embed.add_field(name="Weather", value="\n".join(weather_lines), inline=False)
+        embed.add_field(name="Water updates", value=f"{runs} runs, {sent} commands ({failed} failed)", inline=False)
+        embed.add_field(
+            name="In-game commands",
+            value=f"{sum(command_counts.values())} run" + (f": {top_commands}" if top_commands else "")
+                  + (f"\n{sum(rejections.values())} not run: {rejected}" if rejected else ""),
+            inline=False
+        )
+        embed.add_field(name="Recent seasons", value="\n".join(seasons) or "None recorded yet", inline=False)
         await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="pauseweather", description="Pause weather updates for 4 hours")
@@ -57,16 +196,10 @@ class SeasonCommands(commands.Cog):
             return
 
         set_pause_state(True)
+        bus.publish(PauseToggled(paused=True, by=interaction.user.name))
 
-        # Auto-resume after 4 hours
-        async def auto_resume():
-            await discord.utils.sleep_until(
-                datetime.datetime.utcnow() + datetime.timedelta(hours=4)
-            )
-            set_pause_state(False)
-            await log_to_discord(self.bot, "Weather auto-resumed after 4-hour pause.")
-
-        self.bot.loop.create_task(auto_resume())
+        # Auto-resume after 4 hours; a repeated pause replaces the deadline
+        scheduler.schedule_at("resume_weather", clock.time() + PAUSE_DURATION, "resume_weather")
 
         await interaction.response.send_message("Weather updates paused for 4 hours.")
         await log_to_discord(self.bot, f"Weather paused by {interaction.user.name} for 4 hours.")
@@ -81,5 +214,51 @@ class SeasonCommands(commands.Cog):
             return
 
         set_pause_state(False)
+        bus.publish(PauseToggled(paused=False, by=interaction.user.name))
+        scheduler.cancel("resume_weather")
         await interaction.response.send_message("Weather updates resumed.")
         await log_to_discord(self.bot, f"Weather resumed manually by {interaction.user.name}.")
+
+    @app_commands.command(name="profile", description="Profile the bot's event loop")
+    @app_commands.describe(seconds="How long to sample for")
+    async def profile(self, interaction: Interaction, seconds: app_commands.Range[int, 1, 60] = 10):
+        """
+        Admin-only command that samples the event loop thread's stack for a
+        few seconds and reports where the time went, plus loop lag and the
+        most recent callback that blocked the loop. The full collapsed
+        stacks are attached for flamegraph tools, and the stacks of the
+        recent slow callbacks as slow_callbacks.txt.
+        """
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("You must be an admin to use this command.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            samples, stacks = await asyncio.to_thread(monitor.profile, seconds)
+        except RuntimeError as e:
+            await interaction.followup.send(str(e), ephemeral=True)
+            return
+
+        stats = monitor.stats()
+        lines = [
+            f"**{samples} samples over {seconds}s**",
+            f"Loop lag p50/p99/max: {stats['lag_ms_p50']} / {stats['lag_ms_p99']} / {stats['lag_ms_max']} ms, "
+            f"slow callbacks: {stats['slow_callbacks']}",
+            "```",
+        ]
+        lines += [f"{share:6.1%}  {frame}" for frame, share in top_functions(stacks)]
+        lines.append("```")
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.items())
+        files = [discord.File(io.BytesIO(collapsed.encode("utf8")), filename="profile.folded")]
+        if monitor.slow_callbacks:
+            slowest = monitor.slow_callbacks[-1]
+            # The innermost frame is the line that held the loop
+            frames = [line.strip() for line in slowest["stack"].strip().splitlines() if line.startswith("  File")]
+            where = f" at `{frames[-1]}`" if frames else ""
+            lines.append(f"Last slow callback: {slowest['task']} blocked {slowest['blocked_ms']} ms{where} "
+                         f"(stacks in slow_callbacks.txt)")
+            report = format_slow_callbacks(monitor.slow_callbacks)
+            files.append(discord.File(io.BytesIO(report.encode("utf8")), filename="slow_callbacks.txt"))
+
+        await interaction.followup.send("\n".join(lines)[:2000], files=files, ephemeral=True)
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -5,13 +6,80 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 RCON_HOST = os.getenv("RCON_HOST")
-RCON_PORT = int(os.getenv("RCON_PORT"))
+RCON_PORT = int(os.getenv("RCON_PORT", "0"))
 RCON_PASSWORD = os.getenv("RCON_PASSWORD")
 GUILD_ID = int(os.getenv("GUILD_ID", "0"))
 
+# Game servers that share the season and weather, as a JSON list:
+#   RCON_SERVERS=[{"id": "main", "host": "1.2.3.4", "port": 8888, "password": "..."}, ...]
+# The first entry is the default for webhooks that don't name a server.
+# Without it, RCON_HOST/RCON_PORT/RCON_PASSWORD describe a single server "main".
+if os.getenv("RCON_SERVERS"):
+    RCON_SERVERS = json.loads(os.getenv("RCON_SERVERS"))
+else:
+    RCON_SERVERS = [{"id": "main", "host": RCON_HOST, "port": RCON_PORT, "password": RCON_PASSWORD}]
+
+# Start of a Blooming (naive UTC ISO timestamp, e.g. 2026-03-01T00:00:00).
+# Every season boundary is computed from it. Only used until an anchor is
+# stored (first run or a manual season change); see season_manager.
+SEASON_ANCHOR = os.getenv("SEASON_ANCHOR")
+
 CHANNEL_IDS = {
     "season": 1303375972258812036,
     "announcements": 1303378387947229225,
     "weather_updates": 1359519868168437790,
     "bot_logs": 1359506060414812284
 }
+
+# In-game webhook: set to 1 to queue commands and reply right away with a
+# job id (202) instead of waiting on RCON and replying with the result
+WEBHOOK_ASYNC_JOBS = os.getenv("WEBHOOK_ASYNC_JOBS", "0") == "1"
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+
+# In-game command limits: tokens refill per second up to the burst size
+COMMAND_RATE_PER_USER = float(os.getenv("COMMAND_RATE_PER_USER", "0.2"))
+COMMAND_BURST_PER_USER = int(os.getenv("COMMAND_BURST_PER_USER", "3"))
+COMMAND_RATE_GLOBAL = float(os.getenv("COMMAND_RATE_GLOBAL", "5"))
+COMMAND_BURST_GLOBAL = int(os.getenv("COMMAND_BURST_GLOBAL", "20"))
+COMMAND_DEDUP_SECONDS = float(os.getenv("COMMAND_DEDUP_SECONDS", "10"))
+
+# RCON circuit breaker: open after this many consecutive failures, then
+# probe again after a backoff that doubles per failed probe (with jitter)
+RCON_BREAKER_THRESHOLD = int(os.getenv("RCON_BREAKER_THRESHOLD", "3"))
+RCON_BREAKER_BASE_DELAY = float(os.getenv("RCON_BREAKER_BASE_DELAY", "5"))
+RCON_BREAKER_MAX_DELAY = float(os.getenv("RCON_BREAKER_MAX_DELAY", "300"))
+
+# RCON dispatcher: player commands go before weather, weather before bulk
+# water updates. Limits are queued requests per class; bulk batches are
+# split into chunks so higher classes can cut in between them.
+RCON_DISPATCH_WORKERS = int(os.getenv("RCON_DISPATCH_WORKERS", "4"))
+RCON_QUEUE_INTERACTIVE = int(os.getenv("RCON_QUEUE_INTERACTIVE", "50"))
+RCON_QUEUE_WEATHER = int(os.getenv("RCON_QUEUE_WEATHER", "10"))
+RCON_QUEUE_BULK = int(os.getenv("RCON_QUEUE_BULK", "50"))
+RCON_BULK_CHUNK = int(os.getenv("RCON_BULK_CHUNK", "8"))
+
+# Water transitions: at a season change each source ramps to its new
+# quality over this many minutes instead of jumping (0 = jump at once),
+# moving MIN_CHANGE at a time. Each step (seconds) sends an even share of
+# the ramp's updates per server, never more than the budget; a budget too
+# low to finish inside the window is logged as a warning.
+WATER_TRANSITION_MINUTES = float(os.getenv("WATER_TRANSITION_MINUTES", "60"))
+WATER_TRANSITION_STEP = float(os.getenv("WATER_TRANSITION_STEP", "60"))
+WATER_TRANSITION_BUDGET = int(os.getenv("WATER_TRANSITION_BUDGET", "6"))
+WATER_TRANSITION_MIN_CHANGE = int(os.getenv("WATER_TRANSITION_MIN_CHANGE", "20"))
+
+# Event-loop monitor: how often to sample loop lag, and how long a single
+# callback may hold the loop before its stack is captured (seconds)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_SLOW_CALLBACK = float(os.getenv("LOOP_SLOW_CALLBACK", "0.1"))
+
+# Where state lives. "json" (the default) keeps it in memory and writes
+# data.json from a background thread, coalescing bursts of changes, so a
+# set_* call never waits on the disk. "sqlite" commits every set_* to
+# STORAGE_DB right away (a synchronous write on the event loop, but
+# nothing is lost on a crash) and imports data.json once.
+# History is always kept in STORAGE_DB.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+STORAGE_DB = os.getenv("STORAGE_DB", "twh.db")
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "180"))
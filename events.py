@@ -0,0 +1,76 @@
+"""
+In-process publish/subscribe bus.
+
+Managers publish typed events when something changes and subscribe to the
+events they care about, so a season flip reaches the weather and water
+managers straight away instead of waiting for their next scheduled run.
+"""
+import asyncio
+import inspect
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass(frozen=True)
+class SeasonChanged:
+    season: str
+    start: str                      # ISO timestamps, as in current_season()
+    end: str
+    previous: Optional[str] = None
+
+@dataclass(frozen=True)
+class WeatherChanged:
+    weather: str
+    season: str
+
+@dataclass(frozen=True)
+class PauseToggled:
+    paused: bool
+    by: Optional[str] = None        # None when the pause expired on its own
+
+class EventBus:
+    """
+    Handlers are called in subscription order. Plain functions run inline
+    inside publish(); coroutine functions are started as tasks, so a slow
+    subscriber never holds up the publisher. A handler that raises is
+    reported and does not affect the others.
+    """
+    def __init__(self):
+        self._handlers = {}
+        self._tasks = set()
+
+    def subscribe(self, event_type, handler):
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def unsubscribe(self, event_type, handler):
+        handlers = self._handlers.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def publish(self, event):
+        for handler in list(self._handlers.get(type(event), [])):
+            try:
+                result = handler(event)
+            except Exception as e:
+                print(f"[Events] {_name(handler)} failed on {type(event).__name__}: {e!r}")
+                continue
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._tasks.add(task)
+                task.add_done_callback(lambda t, h=handler, ev=event: self._finished(t, h, ev))
+
+    def _finished(self, task, handler, event):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[Events] {_name(handler)} failed on {type(event).__name__}: {task.exception()!r}")
+
+    async def drain(self):
+        """
+        Waits until every handler task started so far has finished.
+        """
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+def _name(handler):
+    return getattr(handler, "__qualname__", repr(handler))
+
+bus = EventBus()
@@ -0,0 +1,191 @@
+"""
+Local fake Source RCON server for development.
+
+Runs entirely offline. test_rcon_client.py checks the asyncio client
+against it (id matching with out-of-order replies, batch order, split
+responses, reconnect, auth failure); `python fake_rcon.py` compares
+throughput against the thread-executor path the bot used before
+rcon_client.py.
+"""
+import argparse
+import asyncio
+import random
+import time
+from rcon_client import (
+    AsyncRconClient, encode_packet, read_packet,
+    SERVERDATA_AUTH, SERVERDATA_AUTH_RESPONSE, SERVERDATA_EXECCOMMAND,
+    SERVERDATA_RESPONSE_VALUE,
+)
+
+PACKET_SIZE = 4096  # longest response body a Source server puts in one packet
+
+class FakeRconServer:
+    """
+    Speaks just enough of the Source RCON protocol to stand in for the game
+    server. Each command is answered with "ok <command>" after `latency`
+    seconds (plus up to `jitter` seconds), each on its own task, so replies
+    to pipelined commands can come back out of order. Responses longer
+    than `packet_size` are split over several packets, and an empty
+    SERVERDATA_RESPONSE_VALUE is mirrored back once the command sent
+    before it has been answered, like a real Source server.
+    """
+    def __init__(self, password="secret", host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 packet_size=PACKET_SIZE):
+        self.password = password
+        self.packet_size = packet_size
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.connections = 0
+        self.commands = []
+        self._server = None
+        self._writers = set()
+        self._handlers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+        self.drop_connections()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    def drop_connections(self):
+        """Closes every client socket, as a server restart would."""
+        for writer in list(self._writers):
+            writer.close()
+
+    def respond(self, command):
+        return f"ok {command}"
+
+    async def _reply(self, writer, request_id, command):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if not writer.is_closing():
+            body = self.respond(command)
+            chunks = [body[i:i + self.packet_size] for i in range(0, len(body), self.packet_size)] or [""]
+            writer.write(b"".join(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, chunk) for chunk in chunks))
+
+    async def _mirror(self, writer, request_id, after):
+        if after is not None:
+            await asyncio.wait([after])
+        if not writer.is_closing():
+            # Source servers follow the echo with one more packet with this body
+            writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, "")
+                         + encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, "\x00\x01"))
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        authed = False
+        tasks = set()
+        last_command = None
+
+        def spawn(coro):
+            task = asyncio.create_task(coro)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            return task
+
+        try:
+            while True:
+                request_id, packet_type, body = await read_packet(reader)
+                if packet_type == SERVERDATA_AUTH:
+                    authed = body == self.password
+                    writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, ""))
+                    writer.write(encode_packet(request_id if authed else -1, SERVERDATA_AUTH_RESPONSE, ""))
+                elif authed and packet_type == SERVERDATA_EXECCOMMAND:
+                    self.commands.append(body)
+                    last_command = spawn(self._reply(writer, request_id, body))
+                elif authed and packet_type == SERVERDATA_RESPONSE_VALUE:
+                    spawn(self._mirror(writer, request_id, last_command))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+async def _bench_async(server, total, concurrency):
+    client = AsyncRconClient(server.host, server.port, server.password)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await client.command(f"/bench {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed
+
+async def _bench_async_batch(server, total):
+    client = AsyncRconClient(server.host, server.port, server.password)
+    start = time.perf_counter()
+    await client.batch([f"/bench {i}" for i in range(total)])
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed
+
+async def _bench_executor(server, total, concurrency):
+    """
+    The pre-asyncio path: the blocking mcrcon library on the default
+    thread pool, one connection and login per command.
+    """
+    from mcrcon import MCRcon
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def blocking(mcr, command):
+        with mcr:
+            return mcr.command(command)
+
+    async def one(i):
+        async with semaphore:
+            # Built on the loop thread: MCRcon installs a signal handler in
+            # __init__, and timeout=0 keeps it from arming SIGALRM.
+            mcr = MCRcon(server.host, server.password, port=server.port, timeout=0)
+            await loop.run_in_executor(None, blocking, mcr, f"/bench {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start
+
+async def benchmark(total, concurrency, latency):
+    server = await FakeRconServer(latency=latency).start()
+    rows = []
+
+    before = server.connections
+    rows.append(("executor + mcrcon", await _bench_executor(server, total, concurrency), server.connections - before))
+    before = server.connections
+    rows.append(("asyncio client", await _bench_async(server, total, concurrency), server.connections - before))
+    before = server.connections
+    rows.append(("asyncio batch", await _bench_async_batch(server, total), server.connections - before))
+    await server.stop()
+
+    print(f"{total} commands, concurrency {concurrency}, server latency {latency * 1000:.1f} ms")
+    for name, elapsed, connections in rows:
+        print(f"  {name:<18} {elapsed:8.3f} s  {total / elapsed:10.0f} cmd/s  {connections:5d} connections")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake RCON server throughput benchmark")
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.commands, args.concurrency, args.latency_ms / 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Offline load test for the webhook -> RCON path.
+
+Starts the real webhook app on localhost against a FakeRconServer and a
+stubbed Discord client, fires `!teleport`-style and `!setgrowth` posts at
+it with the requested concurrency, and reports throughput, p50/p99
+latency and how many RCON connections and commands it took.
+
+    python loadtest.py --requests 2000 --concurrency 50 --rcon-latency-ms 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+PASSWORD = "loadtest"
+
+class StubChannel:
+    """Counts what the bot would have sent to a Discord channel."""
+    def __init__(self, latency):
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+class StubBot:
+    def __init__(self, latency):
+        self.channel = StubChannel(latency)
+        self.user = None
+
+    def get_channel(self, channel_id):
+        return self.channel
+
+def make_message(i, teleport_ratio, teleports):
+    if random.random() < teleport_ratio:
+        return f"!{random.choice(teleports)}"
+    return f"!setgrowth {random.randint(0, 100) / 100}"
+
+async def wait_for_jobs(job_queue, expected, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        stats = job_queue.stats()
+        if stats["completed"] + stats["failed"] >= expected:
+            return
+        await asyncio.sleep(0.01)
+
+async def run(args):
+    from fake_rcon import FakeRconServer
+
+    rcon_server = await FakeRconServer(password=PASSWORD, latency=args.rcon_latency_ms / 1000).start()
+
+    # config.py reads these at import time, so set them before the bot's
+    # modules are imported. Limits are lifted unless asked for: every
+    # simulated post comes from its own player. Command history goes to a
+    # scratch db, never the live one.
+    workdir = tempfile.TemporaryDirectory(prefix="twh-loadtest-")
+    os.environ["STORAGE_DB"] = os.path.join(workdir.name, "loadtest.db")
+    # RCON_SERVERS wins over RCON_HOST/PORT and may come from the bot's own
+    # .env, so set it explicitly: the fake server must be the only target
+    os.environ["RCON_SERVERS"] = json.dumps([
+        {"id": "loadtest", "host": rcon_server.host, "port": rcon_server.port, "password": PASSWORD}
+    ])
+    os.environ["WEBHOOK_WORKERS"] = str(args.workers)
+    os.environ["WEBHOOK_QUEUE_SIZE"] = str(args.queue_size)
+    if not args.with_limits:
+        os.environ["COMMAND_RATE_GLOBAL"] = "1000000"
+        os.environ["COMMAND_BURST_GLOBAL"] = "1000000"
+
+    from aiohttp import ClientSession, web
+    from webhook_listener import create_webhook_app, TELEPORT_LOCATIONS
+    from metrics import percentile_ms
+    import rcon
+
+    targets = [(server.client.host, server.client.port) for server in rcon.servers.values()]
+    if targets != [(rcon_server.host, rcon_server.port)]:
+        raise SystemExit(f"Refusing to run: RCON would go to {targets}, not the fake server")
+
+    bot = StubBot(args.discord_latency_ms / 1000)
+    app = create_webhook_app(bot, async_jobs=args.mode == "async")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}/"
+
+    teleports = list(TELEPORT_LOCATIONS)
+    latencies = []
+    statuses = {}
+    next_index = iter(range(args.requests))
+
+    async def client(session):
+        for i in next_index:
+            payload = {
+                "username": f"player{i}",
+                "message": make_message(i, args.teleport_ratio, teleports),
+            }
+            start = time.perf_counter()
+            async with session.post(url, json=payload) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(args.concurrency)))
+    acked = time.perf_counter() - start
+
+    job_stats = None
+    if args.mode == "async":
+        job_queue = app["job_queue"]
+        await wait_for_jobs(job_queue, statuses.get(202, 0))
+        job_stats = job_queue.stats()
+        completed = job_stats["completed"]
+    else:
+        completed = statuses.get(200, 0)
+    finished = time.perf_counter() - start
+
+    # Let the log sink flush before counting Discord sends
+    await asyncio.sleep(2.5)
+    await runner.cleanup()
+    await rcon_server.stop()
+    workdir.cleanup()
+
+    print(f"mode={args.mode} requests={args.requests} concurrency={args.concurrency} "
+          f"workers={args.workers} queue={args.queue_size} rcon_latency={args.rcon_latency_ms}ms discord_latency={args.discord_latency_ms}ms")
+    print(f"  HTTP statuses        {dict(sorted(statuses.items()))}")
+    print(f"  acknowledged         {args.requests / acked:10.0f} req/s  ({acked:.3f} s)")
+    # Only commands that ran to completion; rejected and failed ones don't count
+    print(f"  fully processed      {completed / finished:10.0f} req/s  ({completed} in {finished:.3f} s)")
+    print(f"  HTTP latency p50/p99 {percentile_ms(latencies, 0.50):8.2f} / {percentile_ms(latencies, 0.99):.2f} ms")
+    if job_stats:
+        print(f"  job latency p50/p99  {job_stats['latency_ms_p50']:8.2f} / {job_stats['latency_ms_p99']:.2f} ms")
+    print(f"  RCON connections     {rcon_server.connections:10d}")
+    print(f"  RCON commands        {len(rcon_server.commands):10d}")
+    print(f"  Discord sends        {bot.channel.sent:10d}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the webhook -> RCON path offline")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mode", choices=["async", "sync"], default="async",
+                        help="async: queue jobs and reply at once; sync: reply after RCON finishes")
+    parser.add_argument("--workers", type=int, default=4, help="job queue workers (async mode)")
+    parser.add_argument("--queue-size", type=int, default=100, help="job queue capacity (async mode)")
+    parser.add_argument("--teleport-ratio", type=float, default=0.5,
+                        help="share of posts that are teleports; the rest are !setgrowth")
+    parser.add_argument("--rcon-latency-ms", type=float, default=2.0)
+    parser.add_argument("--discord-latency-ms", type=float, default=50.0)
+    parser.add_argument("--with-limits", action="store_true",
+                        help="keep the configured global command rate limit")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,161 @@
+import asyncio
+import collections
+import discord
+import metrics
 from config import CHANNEL_IDS
 
+DISCORD_MESSAGE_LIMIT = 2000
+LOG_FLUSH_INTERVAL = 2.0   # seconds to gather more lines before sending
+LOG_BUFFER_LINES = 500     # oldest lines are dropped beyond this
+LOG_MAX_BACKOFF = 60.0     # seconds between retries while Discord is failing
+
+class DiscordLogSink:
+    """
+    Background queue for the #bot-logs channel.
+    Callers only append to an in-memory buffer. A single task merges the
+    buffered lines into as few messages as fit in Discord's 2000-character
+    limit, sending when a message is full or LOG_FLUSH_INTERVAL has passed.
+    The buffer is bounded: while Discord is down or rate limiting us, the
+    oldest lines are dropped and counted instead of growing memory.
+    """
+    def __init__(self, bot, channel_id, flush_interval=LOG_FLUSH_INTERVAL, max_lines=LOG_BUFFER_LINES):
+        self.bot = bot
+        self.channel_id = channel_id
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self._lines = collections.deque()
+        self._chars = 0
+        self._has_lines = asyncio.Event()
+        self._has_full_message = asyncio.Event()
+        self._task = None
+        self._unreported_drops = 0
+
+        self.dropped = 0
+        self.sent_messages = 0
+        self.sent_lines = 0
+
+    def enqueue(self, message: str):
+        if len(message) > DISCORD_MESSAGE_LIMIT:
+            message = message[:DISCORD_MESSAGE_LIMIT - 3] + "..."
+        if len(self._lines) >= self.max_lines:
+            self._chars -= len(self._lines.popleft()) + 1
+            self.dropped += 1
+            self._unreported_drops += 1
+        self._lines.append(message)
+        self._chars += len(message) + 1
+
+        self._has_lines.set()
+        if self._chars >= DISCORD_MESSAGE_LIMIT:
+            self._has_full_message.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _take_message(self):
+        """
+        Pops as many buffered lines as fit into one Discord message.
+        Returns (drops_reported, lines, text).
+        """
+        drops = self._unreported_drops
+        self._unreported_drops = 0
+        parts = [f"[... {drops} log lines dropped]"] if drops else []
+        lines = []
+        length = len(parts[0]) if parts else 0
+
+        while self._lines:
+            line = self._lines[0]
+            added = len(line) + (1 if parts else 0)
+            if parts and length + added > DISCORD_MESSAGE_LIMIT:
+                break
+            self._lines.popleft()
+            self._chars -= len(line) + 1
+            parts.append(line)
+            lines.append(line)
+            length += added
+
+        if not self._lines:
+            self._has_lines.clear()
+        if self._chars < DISCORD_MESSAGE_LIMIT:
+            self._has_full_message.clear()
+        return drops, lines, "\n".join(parts)
+
+    def _requeue(self, drops, lines):
+        """
+        Puts unsent lines back at the front, without exceeding the bound.
+        """
+        self._unreported_drops += drops
+        for line in reversed(lines):
+            if len(self._lines) >= self.max_lines:
+                self.dropped += 1
+                self._unreported_drops += 1
+                continue
+            self._lines.appendleft(line)
+            self._chars += len(line) + 1
+        self._has_lines.set()
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            await self._has_lines.wait()
+            if not self._has_full_message.is_set():
+                try:
+                    await asyncio.wait_for(self._has_full_message.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            drops, lines, text = self._take_message()
+            if not text:
+                continue
+
+            channel = self.bot.get_channel(self.channel_id)
+            if channel is None:
+                print(f"[LOG - channel not found]: {text}")
+                continue
+
+            try:
+                with metrics.DISCORD_SEND_SECONDS.time(kind="log"):
+                    await channel.send(text)
+                self.sent_messages += 1
+                self.sent_lines += len(lines)
+                backoff = 1.0
+            except discord.RateLimited as e:
+                self._requeue(drops, lines)
+                await asyncio.sleep(e.retry_after)
+            except discord.HTTPException as e:
+                if 400 <= e.status < 500 and e.status != 429:
+                    # Missing permissions, bad request: retrying won't help
+                    print(f"[LOG ERROR] Discord rejected log message ({e.status}): {text}")
+                    self.dropped += len(lines)
+                    continue
+                self._requeue(drops, lines)
+                retry_after = None
+                if e.status == 429 and e.response is not None:
+                    retry_after = e.response.headers.get("Retry-After")
+                await asyncio.sleep(float(retry_after) if retry_after else backoff)
+                backoff = min(backoff * 2, LOG_MAX_BACKOFF)
+            except Exception as e:
+                print(f"[LOG ERROR] Failed to send log message: {e}")
+                self._requeue(drops, lines)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, LOG_MAX_BACKOFF)
+
+_sink = None
+metrics.DISCORD_LOG_DROPPED.set_callback(lambda: _sink.dropped if _sink else 0)
+
+def get_log_sink(bot):
+    global _sink
+    if _sink is None or _sink.bot is not bot:
+        _sink = DiscordLogSink(bot, CHANNEL_IDS["bot_logs"])
+    return _sink
+
 async def log_to_discord(bot, message: str):
     """
-    Sends a log message to the #bot-logs channel on Discord.
-    If bot is None (or the channel isn't found), it prints to console instead.
+    Queues a log message for the #bot-logs channel on Discord and returns
+    immediately; the sink sends it in the background.
+    If bot is None, it prints to console instead.
     """
     # If the bot reference is missing, just print.
     if not bot:
         print(f"[LOG - no bot reference]: {message}")
         return
 
-    channel = bot.get_channel(CHANNEL_IDS["bot_logs"])
-    if channel:
-        await channel.send(message)
-    else:
-        print(f"[LOG - channel not found]: {message}")
+    get_log_sink(bot).enqueue(message)
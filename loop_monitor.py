@@ -0,0 +1,200 @@
+"""
+Event-loop health: lag sampling, a slow-callback watchdog and an
+on-demand sampling profiler.
+
+Everything in the bot (the Discord gateway, the webhook server, the
+scheduler's jobs) shares one event loop, so any callback that blocks it
+delays all of them. The monitor measures how late the loop wakes up,
+and a watchdog thread captures the loop thread's stack whenever a
+single callback holds the loop longer than LOOP_SLOW_CALLBACK.
+"""
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+import metrics
+from config import LOOP_LAG_INTERVAL, LOOP_SLOW_CALLBACK
+
+LAG_SAMPLES = 1000       # recent lag samples kept for the percentiles
+SLOW_REPORTS = 20        # recent slow-callback reports kept for /profile
+HEARTBEAT = 0.02         # seconds between loop heartbeats the watchdog checks
+PROFILE_INTERVAL = 0.005 # seconds between profiler samples
+
+def _describe_task(task):
+    if task is None:
+        return "(no task: plain callback)"
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", repr(coro))
+
+class LoopMonitor:
+    """
+    Started from inside the loop it watches. The lag sampler sleeps for
+    `interval` and records how much later than that it woke up. The
+    heartbeat is a call_later chain the watchdog thread checks: when it
+    stops for longer than `slow_threshold`, the loop is stuck in one
+    callback and the thread records that callback's task and stack.
+    """
+    def __init__(self, interval=LOOP_LAG_INTERVAL, slow_threshold=LOOP_SLOW_CALLBACK):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.lags = collections.deque(maxlen=LAG_SAMPLES)
+        self.slow_callbacks = collections.deque(maxlen=SLOW_REPORTS)
+        self.slow_count = 0
+        self._loop = None
+        self._loop_thread = None
+        self._sampler = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+        self._last_beat = time.monotonic()
+        self._profiling = threading.Lock()
+
+    @property
+    def running(self):
+        return self._sampler is not None and not self._sampler.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopping.clear()
+        self._last_beat = time.monotonic()
+        self._loop.call_soon(self._beat)
+        self._sampler = asyncio.create_task(self._sample_lag())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            await asyncio.gather(self._sampler, return_exceptions=True)
+
+    # --- Loop side ---
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        if not self._stopping.is_set():
+            self._loop.call_later(HEARTBEAT, self._beat)
+
+    async def _sample_lag(self):
+        while True:
+            start = self._loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self._loop.time() - start - self.interval)
+            self.lags.append(lag)
+            metrics.LOOP_LAG_SECONDS.observe(lag)
+
+    # --- Watchdog thread ---
+
+    def _watch(self):
+        stalled_since = None
+        report = None
+        while not self._stopping.wait(HEARTBEAT):
+            last_beat = self._last_beat
+            blocked = time.monotonic() - last_beat
+            if blocked < self.slow_threshold:
+                if report is not None:
+                    # The stall is over: record how long it really lasted
+                    report["blocked_ms"] = round((last_beat - stalled_since) * 1000, 1)
+                    print(f"[LoopMonitor] Event loop blocked {report['blocked_ms']} ms in {report['task']}\n{report['stack']}")
+                    report = None
+                continue
+            if report is not None:
+                continue
+
+            stalled_since = last_beat
+            report = self._capture(blocked)
+            self.slow_callbacks.append(report)
+            self.slow_count += 1
+            metrics.LOOP_SLOW_CALLBACKS.inc()
+
+    def _capture(self, blocked):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        return {
+            "at": time.time(),
+            "blocked_ms": round(blocked * 1000, 1),
+            "task": _describe_task(asyncio.current_task(self._loop)),
+            "stack": stack,
+        }
+
+    # --- Reporting ---
+
+    def lag_percentiles(self):
+        """
+        {quantile: lag seconds} over the recent samples, for the gauge.
+        """
+        samples = list(self.lags)
+        return {
+            (quantile,): metrics.percentile(samples, float(quantile)) or 0.0
+            for quantile in ("0.5", "0.9", "0.99")
+        }
+
+    def stats(self):
+        samples = list(self.lags)
+        return {
+            "lag_ms_p50": metrics.percentile_ms(samples, 0.50),
+            "lag_ms_p99": metrics.percentile_ms(samples, 0.99),
+            "lag_ms_max": round(max(samples) * 1000, 1) if samples else None,
+            "slow_callbacks": self.slow_count,
+        }
+
+    # --- Profiler ---
+
+    def profile(self, duration):
+        """
+        Samples the loop thread's stack every PROFILE_INTERVAL for
+        `duration` seconds. Blocking: run it in a thread, never on the loop.
+        Returns (samples taken, Counter of collapsed "a;b;c" stacks), the
+        input format flamegraph tools expect. Raises RuntimeError if a
+        profile is already running.
+        """
+        if not self._profiling.acquire(blocking=False):
+            raise RuntimeError("A profile is already running.")
+        try:
+            stacks = collections.Counter()
+            samples = 0
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stacks[";".join(reversed(names))] += 1
+                    samples += 1
+                time.sleep(PROFILE_INTERVAL)
+            return samples, stacks
+        finally:
+            self._profiling.release()
+
+def format_slow_callbacks(reports):
+    """
+    Plain-text report of slow callbacks, newest first: when, how long,
+    which task and the loop thread's stack at the time.
+    """
+    blocks = []
+    for report in reversed(reports):
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(report["at"]))
+        blocks.append(f"{when} UTC  blocked {report['blocked_ms']} ms in {report['task']}\n{report['stack']}")
+    return "\n".join(blocks)
+
+def top_functions(stacks, limit=10):
+    """
+    [(frame, share of samples)] by self time: the innermost frame of each
+    sample, i.e. the code that was actually running. When the loop is
+    idle that is the selector's poll call.
+    """
+    total = sum(stacks.values())
+    leaves = collections.Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    return [(name, count / total) for name, count in leaves.most_common(limit)] if total else []
+
+monitor = LoopMonitor()
+metrics.LOOP_LAG_QUANTILES.set_callback(monitor.lag_percentiles)
@@ -1,4 +1,7 @@
 import asyncio
+import hashlib
+import json
+import clock
 import discord
 from discord.ext import commands
 from discord import Intents
@@ -9,6 +12,9 @@ from weather_manager import WeatherManager
 from water_manager import WaterManager
 from webhook_listener import run_webhook_listener
 from commands import SeasonCommands
+from scheduler import scheduler
+from loop_monitor import monitor
+from storage import get_command_hash, set_command_hash, prune_history
 
 intents = Intents.default()
 intents.message_content = True
@@ -19,17 +25,82 @@ season_manager = SeasonManager(bot)
 weather_manager = WeatherManager(bot)
 water_manager = WaterManager()
 
-@bot.event
-async def on_ready():
-    print(f"Bot connected as {bot.user}")
+async def prune_history_job():
+    removed = prune_history()
+    if removed:
+        print(f"Pruned {removed} history rows past the retention window.")
+
+def start_scheduler():
+    """
+    Registers every periodic job with the shared scheduler and starts it.
+    Safe to call again: on_ready fires on every gateway reconnect.
+    """
+    if scheduler.running:
+        return
+    scheduler.register_handler("season_boundary", season_manager.run_boundary)
+    scheduler.add_periodic("weather", weather_manager.weather_interval, weather_manager.run_tick)
+    scheduler.add_periodic("water", water_manager.interval, water_manager.apply_water_logic)
+    scheduler.add_periodic("water_transition", water_manager.transition_step, water_manager.run_transition_tick)
+    scheduler.add_periodic("history_prune", 24 * 60 * 60, prune_history_job)
+    # One-shot deadlines (e.g. weather pause expiry) need the cog's handlers
+    scheduler.restore()
+    # Check the season now; the handler then re-arms itself for the exact
+    # moment the current season ends
+    scheduler.schedule_at("season", clock.time(), "season_boundary")
+    scheduler.start()
+
+def command_tree_hash(guild):
+    """
+    Stable hash of the payload a sync would upload for this guild, so
+    startup only syncs when a command, option or description changed.
+    Call after copy_global_to: the cog's commands are global until then.
+    """
+    payload = []
+    for command in bot.tree.get_commands(guild=guild):
+        try:
+            payload.append(command.to_dict(bot.tree))
+        except TypeError:
+            # discord.py < 2.4 takes no tree argument
+            payload.append(command.to_dict())
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    text = json.dumps({"guild": guild.id, "commands": payload}, sort_keys=True)
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
 
+@bot.event
+async def setup_hook():
+    """
+    Runs once after login, before the gateway connects. Reconnects only
+    fire on_ready again, so nothing here is repeated.
+    """
+    monitor.start()
     await bot.add_cog(SeasonCommands(bot))
+    # In-game webhooks, /metrics, /jobs, /ratelimit and /rcon
+    try:
+        await run_webhook_listener(bot)
+    except OSError as e:
+        print(f"Failed to start the webhook listener: {e}")
 
-    # Just sync commands and NOTHING ELSE
+    # The cog's commands are global; copy them to the guild so the sync
+    # (and the hash of what it uploads) includes them
     guild = discord.Object(id=GUILD_ID)
-    synced = await bot.tree.sync(guild=guild)
+    bot.tree.copy_global_to(guild=guild)
+    tree_hash = command_tree_hash(guild)
+    if tree_hash == get_command_hash():
+        print(f"Slash commands unchanged, skipping sync to guild {GUILD_ID}.")
+        return
+    try:
+        synced = await bot.tree.sync(guild=guild)
+    except Exception as e:
+        print(f"Failed to sync commands: {e}")
+        return
+    set_command_hash(tree_hash)
     print(f"Synced {len(synced)} slash commands to guild {GUILD_ID}.")
 
+@bot.event
+async def on_ready():
+    print(f"Bot connected as {bot.user}")
+    start_scheduler()
+
 
 #@bot.event
 #async def on_ready():
@@ -56,6 +127,5 @@ async def on_ready():
     # Run loops as background tasks
    # asyncio.create_task(weather_manager.start_weather_loop())
   #  asyncio.create_task(water_manager.start_water_loop())
-   # asyncio.create_task(run_webhook_listener(bot))
 
 bot.run(BOT_TOKEN)
@@ -0,0 +1,210 @@
+"""
+Minimal Prometheus text-format metrics, served at GET /metrics by the
+webhook listener. Every metric the bot exports is declared at the bottom
+of this file so there is one place to look when writing alert rules.
+"""
+import bisect
+import contextlib
+import math
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, key, (), value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. Instead of being set, a gauge can be
+    given a callback that is read at scrape time; it returns a number, or
+    for labelled gauges a dict of {label_values_tuple: number}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._callback = None
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def _samples(self):
+        if self._callback is None:
+            yield from super()._samples()
+            return
+        try:
+            result = self._callback()
+        except Exception as e:
+            print(f"[Metrics] Gauge {self.name} callback failed: {e}")
+            return
+        if not isinstance(result, dict):
+            result = {(): result}
+        for key, value in sorted(result.items()):
+            yield self.name, tuple(str(v) for v in key), (), value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", key, (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_sum", key, (), total
+            yield f"{self.name}_count", key, (), count
+
+def render():
+    """
+    Returns every registered metric in Prometheus text exposition format.
+    """
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+def percentile(samples, p):
+    """
+    Nearest-rank percentile (p from 0 to 1) of a short window of samples,
+    or None if there are none. For the in-process stats (/jobs, /rcon,
+    /profile); the histograms above are what Prometheus aggregates.
+    """
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+def percentile_ms(samples, p):
+    """
+    percentile() of samples in seconds, as milliseconds rounded for display.
+    """
+    value = percentile(samples, p)
+    return None if value is None else round(value * 1000, 1)
+
+# --- Metrics exported by the bot ---
+
+WEBHOOK_SECONDS = Histogram(
+    "twh_webhook_seconds", "Time to answer an in-game webhook POST", ["outcome"])
+INGAME_COMMANDS = Counter(
+    "twh_ingame_commands_total", "In-game commands received, by command and outcome", ["command", "outcome"])
+JOB_QUEUE_DEPTH = Gauge(
+    "twh_job_queue_depth", "In-game command jobs waiting for a worker")
+JOB_SECONDS = Histogram(
+    "twh_job_seconds", "Time from queuing an in-game command job to finishing it")
+
+RCON_COMMAND_SECONDS = Histogram(
+    "twh_rcon_command_seconds", "RCON round trip per command or batch", ["server", "command", "mode"])
+RCON_FAILURES = Counter(
+    "twh_rcon_failures_total", "Failed RCON commands, by command and error", ["server", "command", "error"])
+RCON_QUEUE_DEPTH = Gauge(
+    "twh_rcon_queue_depth", "RCON requests waiting in the dispatcher, by priority", ["server", "priority"])
+RCON_QUEUE_SECONDS = Histogram(
+    "twh_rcon_queue_seconds", "Time an RCON request waited in the dispatcher queue", ["server", "priority"])
+RCON_BREAKER_STATE = Gauge(
+    "twh_rcon_breaker_state", "RCON circuit breaker: 0 closed, 1 half-open, 2 open", ["server"])
+RCON_REJECTED = Counter(
+    "twh_rcon_rejected_total", "RCON commands failed fast because the circuit breaker was open", ["server", "command"])
+
+DISCORD_SEND_SECONDS = Histogram(
+    "twh_discord_send_seconds", "Time spent in Discord API sends", ["kind"])
+DISCORD_LOG_DROPPED = Gauge(
+    "twh_discord_log_dropped_lines", "Log lines dropped because the Discord log buffer was full")
+
+STORAGE_SECONDS = Histogram(
+    "twh_storage_seconds", "Time spent in storage reads, writes and flushes", ["op"],
+    buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0))
+
+WEATHER_PAUSED = Gauge(
+    "twh_weather_paused", "1 while weather updates are paused")
+CURRENT_SEASON = Gauge(
+    "twh_current_season", "1 for the season currently in effect", ["season"])
+LOOP_ITERATION_SECONDS = Gauge(
+    "twh_loop_iteration_seconds", "Duration of the latest run of a periodic loop", ["loop"])
+LOOP_LAST_RUN = Gauge(
+    "twh_loop_last_run_timestamp_seconds", "Unix time the periodic loop last finished a run", ["loop"])
+LOOP_LAG_SECONDS = Histogram(
+    "twh_event_loop_lag_seconds", "How late the event loop woke up from a timed sleep")
+LOOP_LAG_QUANTILES = Gauge(
+    "twh_event_loop_lag_quantile_seconds", "Event loop lag percentiles over the recent samples", ["quantile"])
+LOOP_SLOW_CALLBACKS = Counter(
+    "twh_event_loop_slow_callbacks_total", "Callbacks that blocked the event loop past the threshold")
+
+@contextlib.contextmanager
+def time_loop(loop_name):
+    """
+    Records how long one iteration of a periodic loop took and when it ended.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        LOOP_ITERATION_SECONDS.set(time.perf_counter() - start, loop=loop_name)
+        LOOP_LAST_RUN.set(time.time(), loop=loop_name)
@@ -0,0 +1,136 @@
+import time
+from config import (
+    COMMAND_RATE_PER_USER, COMMAND_BURST_PER_USER,
+    COMMAND_RATE_GLOBAL, COMMAND_BURST_GLOBAL,
+    COMMAND_DEDUP_SECONDS,
+)
+
+ALLOWED = "allowed"
+DUPLICATE = "duplicate"
+RATE_LIMITED = "rate_limited"
+
+PRUNE_INTERVAL = 300  # seconds between sweeps of idle per-user state
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `burst` tokens, refilled at `rate`
+    tokens per second. Each command takes one token.
+    """
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+class CommandLimiter:
+    """
+    Gatekeeper in front of in-game command dispatch.
+    Identical commands from the same player inside the dedup window are
+    coalesced into the first one; everything else must get a token from
+    both the player's bucket and the global bucket.
+    An ALLOWED verdict reserves the tokens and the dedup slot; call
+    release() if the command then never ran (queue full, RCON failure)
+    so the player can retry at once.
+    """
+    def __init__(self, user_rate=COMMAND_RATE_PER_USER, user_burst=COMMAND_BURST_PER_USER,
+                 global_rate=COMMAND_RATE_GLOBAL, global_burst=COMMAND_BURST_GLOBAL,
+                 dedup_seconds=COMMAND_DEDUP_SECONDS):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.dedup_seconds = dedup_seconds
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._user_buckets = {}
+        self._recent = {}  # (username, command) -> time it was last allowed
+        self._last_prune = time.monotonic()
+
+        self.allowed = 0
+        self.coalesced = 0
+        self.rejected_user = 0
+        self.rejected_global = 0
+        self.released = 0
+
+    def _dedup_key(self, username, command):
+        return username.lower(), " ".join(command.lower().split())
+
+    def check(self, username: str, command: str, now=None):
+        """
+        Returns ALLOWED, DUPLICATE or RATE_LIMITED for one command.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._prune(now)
+
+        key = self._dedup_key(username, command)
+        user = key[0]
+        last = self._recent.get(key)
+        if last is not None and now - last < self.dedup_seconds:
+            self.coalesced += 1
+            return DUPLICATE
+
+        bucket = self._user_buckets.get(user)
+        if bucket is None:
+            bucket = self._user_buckets[user] = TokenBucket(self.user_rate, self.user_burst, now)
+        if not bucket.try_take(now):
+            self.rejected_user += 1
+            return RATE_LIMITED
+        if not self.global_bucket.try_take(now):
+            # Don't charge the player for capacity they never got
+            bucket.refund()
+            self.rejected_global += 1
+            return RATE_LIMITED
+
+        self._recent[key] = now
+        self.allowed += 1
+        return ALLOWED
+
+    def release(self, username: str, command: str):
+        """
+        Undoes an ALLOWED verdict for a command that did not run: forgets
+        it for dedup and hands back the player's and the global token.
+        """
+        key = self._dedup_key(username, command)
+        self._recent.pop(key, None)
+        bucket = self._user_buckets.get(key[0])
+        if bucket is not None:
+            bucket.refund()
+        self.global_bucket.refund()
+        self.released += 1
+
+    def _prune(self, now):
+        self._last_prune = now
+        self._recent = {
+            key: seen for key, seen in self._recent.items()
+            if now - seen < self.dedup_seconds
+        }
+        self._user_buckets = {
+            user: bucket for user, bucket in self._user_buckets.items()
+            if not bucket.is_full(now)
+        }
+
+    def stats(self):
+        return {
+            "allowed": self.allowed,
+            "coalesced": self.coalesced,
+            "rejected_user": self.rejected_user,
+            "rejected_global": self.rejected_global,
+            "released": self.released,
+            "tracked_players": len(self._user_buckets),
+        }
@@ -1,26 +1,393 @@
 import asyncio
-from config import RCON_HOST, RCON_PORT, RCON_PASSWORD
-from mcrcon import MCRcon
+import collections
+import random
+import time
+import metrics
+from config import (
+    RCON_SERVERS,
+    RCON_BREAKER_THRESHOLD, RCON_BREAKER_BASE_DELAY, RCON_BREAKER_MAX_DELAY,
+    RCON_DISPATCH_WORKERS, RCON_BULK_CHUNK,
+    RCON_QUEUE_INTERACTIVE, RCON_QUEUE_WEATHER, RCON_QUEUE_BULK,
+)
+from rcon_client import AsyncRconClient
 
-async def send_rcon_command(command: str):
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    """
+    Stops talking to a game server that keeps failing.
+    Closed: everything goes through. After `threshold` consecutive failures
+    it opens and every call fails fast. Once the backoff has passed it is
+    half-open: a single probe goes through, and its result either closes
+    the breaker or opens it again with twice the backoff (capped at
+    `max_delay`, with jitter so restarts don't probe in lockstep).
+    """
+    def __init__(self, name="rcon", threshold=RCON_BREAKER_THRESHOLD, base_delay=RCON_BREAKER_BASE_DELAY,
+                 max_delay=RCON_BREAKER_MAX_DELAY, clock=time.monotonic):
+        self.name = name
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.failures = 0       # consecutive failures
+        self.trips = 0          # consecutive openings, drives the backoff
+        self.retry_at = None    # when the next probe may go through
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.retry_at is None:
+            return CLOSED
+        if self._probing or self.clock() >= self.retry_at:
+            return HALF_OPEN
+        return OPEN
+
+    def available(self):
+        """
+        True if a call made now would be let through (or could be the
+        probe). Does not reserve the probe.
+        """
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self._probing)
+
+    def allow(self):
+        """
+        Called before each call; False means fail fast. In the half-open
+        state only the first caller gets through, as the probe.
+        """
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.retry_at is not None:
+            print(f"[RCON {self.name}] Game server reachable again, circuit closed.")
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        # Calls already in flight when the breaker opened don't reopen it;
+        # only the probe's result moves the backoff on
+        if self._probing or (self.retry_at is None and self.failures >= self.threshold):
+            self._trip()
+
+    def _trip(self):
+        self.trips += 1
+        self._probing = False
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.trips - 1))
+        delay = random.uniform(delay / 2, delay)
+        self.retry_at = self.clock() + delay
+        print(f"[RCON {self.name}] Circuit open after {self.failures} consecutive failures; next probe in {delay:.1f}s.")
+
+    def stats(self):
+        retry_in = max(0.0, self.retry_at - self.clock()) if self.retry_at is not None else 0.0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "retry_in": round(retry_in, 1),
+        }
+
+# Dispatcher priority classes, highest first
+INTERACTIVE = "interactive"   # in-game player commands
+WEATHER = "weather"           # the 20-minute weather change
+BULK = "bulk"                 # water quality updates
+PRIORITIES = (INTERACTIVE, WEATHER, BULK)
+
+QUEUE_LIMITS = {
+    INTERACTIVE: RCON_QUEUE_INTERACTIVE,
+    WEATHER: RCON_QUEUE_WEATHER,
+    BULK: RCON_QUEUE_BULK,
+}
+LATENCY_SAMPLES = 500  # per class, for the p50/p99 in stats()
+
+class RconUnavailable(Exception):
+    """The circuit breaker was open, so the command was never sent."""
+
+class RconQueueFull(Exception):
+    """The priority class's queue is at its limit."""
+
+class _Request:
+    def __init__(self, commands, single):
+        self.commands = commands
+        self.single = single
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+class RconDispatcher:
+    """
+    The only path to the game server. Requests wait in one bounded queue
+    per priority class and a small pool of workers always takes the
+    oldest request of the highest class that has one, so a player's
+    teleport never waits behind a season's worth of water updates.
+
+    Each class has its own limit. Interactive requests fail fast with
+    RconQueueFull when it is reached (the player can retry); weather and
+    bulk callers wait for space instead, which slows the producer down
+    rather than growing the queue.
+    """
+    def __init__(self, client, breaker, server_id, workers=RCON_DISPATCH_WORKERS, limits=QUEUE_LIMITS):
+        self.server_id = server_id
+        self.client = client
+        self.breaker = breaker
+        self.worker_count = workers
+        self.limits = dict(limits)
+        self._queues = {p: collections.deque() for p in PRIORITIES}
+        self._slots = {p: asyncio.Semaphore(self.limits[p]) for p in PRIORITIES}
+        self._ready = asyncio.Event()
+        self._workers = []
+        self._waits = {p: collections.deque(maxlen=LATENCY_SAMPLES) for p in PRIORITIES}
+        self._latencies = {p: collections.deque(maxlen=LATENCY_SAMPLES) for p in PRIORITIES}
+        self.completed = {p: 0 for p in PRIORITIES}
+        self.rejected = {p: 0 for p in PRIORITIES}
+
+    def _ensure_workers(self):
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, commands, priority=INTERACTIVE, single=False):
+        """
+        Queues commands to go out together and returns their results in
+        order: the response text, or the exception for that command.
+        """
+        slots = self._slots[priority]
+        if priority == INTERACTIVE and slots.locked():
+            self.rejected[priority] += 1
+            raise RconQueueFull(f"{priority} RCON queue is full")
+        await slots.acquire()
+        try:
+            request = _Request(list(commands), single)
+            self._queues[priority].append(request)
+            self._ready.set()
+            self._ensure_workers()
+            return await request.future
+        finally:
+            slots.release()
+
+    def _next(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue:
+                request = queue.popleft()
+                if not request.future.done():  # skip callers that gave up
+                    return priority, request
+        return None, None
+
+    async def _worker(self):
+        while True:
+            priority, request = self._next()
+            if request is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            started = time.monotonic()
+            self._waits[priority].append(started - request.enqueued)
+            metrics.RCON_QUEUE_SECONDS.observe(started - request.enqueued, server=self.server_id, priority=priority)
+            try:
+                results = await self._execute(request)
+            except Exception as e:
+                results = [e] * len(request.commands)
+            self._latencies[priority].append(time.monotonic() - request.enqueued)
+            self.completed[priority] += 1
+            if not request.future.done():
+                request.future.set_result(results)
+
+    async def _execute(self, request):
+        if not self.breaker.allow():
+            return [RconUnavailable("RCON circuit breaker is open")] * len(request.commands)
+
+        name = _command_name(request.commands[0])
+        if request.single:
+            try:
+                with metrics.RCON_COMMAND_SECONDS.time(server=self.server_id, command=name, mode="single"):
+                    results = [await self.client.command(request.commands[0])]
+            except Exception as e:
+                results = [e]
+        else:
+            with metrics.RCON_COMMAND_SECONDS.time(server=self.server_id, command=name, mode="batch"):
+                results = await self.client.batch(request.commands)
+
+        # One request is one call for the breaker: any answer means the
+        # server is up
+        if all(isinstance(result, Exception) for result in results):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return results
+
+    def depth(self):
+        return {(self.server_id, p): len(self._queues[p]) for p in PRIORITIES}
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def stats(self):
+        return {
+            p: {
+                "depth": len(self._queues[p]),
+                "capacity": self.limits[p],
+                "completed": self.completed[p],
+                "rejected": self.rejected[p],
+                "wait_ms_p50": metrics.percentile_ms(self._waits[p], 0.50),
+                "wait_ms_p99": metrics.percentile_ms(self._waits[p], 0.99),
+                "latency_ms_p50": metrics.percentile_ms(self._latencies[p], 0.50),
+                "latency_ms_p99": metrics.percentile_ms(self._latencies[p], 0.99),
+            }
+            for p in PRIORITIES
+        }
+
+class RconServer:
+    """
+    One game server: its own multiplexed connection, circuit breaker and
+    dispatcher, so a server that is down or slow never holds up the rest.
+    """
+    def __init__(self, server_id, host, port, password):
+        self.id = server_id
+        self.client = AsyncRconClient(host, port, password)
+        self.breaker = CircuitBreaker(name=server_id)
+        self.dispatcher = RconDispatcher(self.client, self.breaker, server_id)
+
+    def available(self):
+        return self.breaker.available()
+
+    def _record_failure(self, command, error):
+        name = _command_name(command)
+        if isinstance(error, RconUnavailable):
+            metrics.RCON_REJECTED.inc(server=self.id, command=name)
+        else:
+            metrics.RCON_FAILURES.inc(server=self.id, command=name, error=type(error).__name__)
+
+    async def command(self, command, priority=INTERACTIVE):
+        if not self.available():
+            metrics.RCON_REJECTED.inc(server=self.id, command=_command_name(command))
+            return None
+        try:
+            [result] = await self.dispatcher.submit([command], priority, single=True)
+        except RconQueueFull as e:
+            print(f"[RCON ERROR] {self.id}: dropped '{command}': {e}")
+            return None
+        if isinstance(result, Exception):
+            self._record_failure(command, result)
+            print(f"[RCON ERROR] {self.id}: failed to send '{command}': {result!r}")
+            return None
+        return result
+
+    async def batch(self, commands, priority=BULK):
+        commands = list(commands)
+        if not commands:
+            return []
+        if not self.available():
+            for command in commands:
+                metrics.RCON_REJECTED.inc(server=self.id, command=_command_name(command))
+            return [None] * len(commands)
+
+        if priority == INTERACTIVE:
+            chunks = [commands]
+        else:
+            chunks = [commands[i:i + RCON_BULK_CHUNK] for i in range(0, len(commands), RCON_BULK_CHUNK)]
+        chunk_results = await asyncio.gather(
+            *(self.dispatcher.submit(chunk, priority) for chunk in chunks), return_exceptions=True)
+
+        results = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            if isinstance(chunk_result, Exception):
+                chunk_result = [chunk_result] * len(chunk)
+            for command, result in zip(chunk, chunk_result):
+                if isinstance(result, Exception):
+                    self._record_failure(command, result)
+                    result = None
+                results.append(result)
+
+        failed = [cmd for cmd, result in zip(commands, results) if result is None]
+        if failed:
+            print(f"[RCON ERROR] {self.id}: {len(failed)}/{len(commands)} batch commands failed, first: '{failed[0]}'")
+        return results
+
+    def stats(self):
+        return {"breaker": self.breaker.stats(), "queues": self.dispatcher.stats()}
+
+    async def close(self):
+        await self.dispatcher.close()
+        await self.client.close()
+
+# Every configured game server, by id. Commands run on the event loop
+# itself, so RCON traffic never occupies executor threads.
+servers = {
+    entry["id"]: RconServer(entry["id"], entry["host"], int(entry["port"]), entry["password"])
+    for entry in RCON_SERVERS
+}
+DEFAULT_SERVER = RCON_SERVERS[0]["id"]
+
+metrics.RCON_BREAKER_STATE.set_callback(
+    lambda: {(server.id,): _STATE_VALUES[server.breaker.state] for server in servers.values()})
+metrics.RCON_QUEUE_DEPTH.set_callback(
+    lambda: {key: depth for server in servers.values() for key, depth in server.dispatcher.depth().items()})
+
+def get_server(server_id=None):
+    """
+    The server with this id (the default server for None).
+    Raises KeyError for an unknown id.
+    """
+    return servers[server_id or DEFAULT_SERVER]
+
+def rcon_available(server=None):
+    """
+    False while the server's circuit breaker is open: callers can skip
+    work that would only fail.
+    """
+    return get_server(server).available()
+
+def rcon_stats():
+    return {server_id: server.stats() for server_id, server in servers.items()}
+
+async def send_rcon_command(command: str, priority=INTERACTIVE, server=None):
+    """
+    Allows you to send an RCON command asynchronously to one server (the
+    default server unless given).
+    Returns the server's response if successful, or None if it fails
+    (immediately, while the circuit breaker is open).
+    """
+    return await get_server(server).command(command, priority)
+
+async def send_rcon_batch(commands, priority=BULK, server=None):
+    """
+    Sends many RCON commands to one server over its shared connection as
+    pipelined writes.
+    Returns the responses in the same order as the commands, with None
+    for every command that failed. Below interactive priority the batch
+    goes out in RCON_BULK_CHUNK-sized pieces that may run concurrently,
+    so only use it for commands that don't depend on each other's order.
+    """
+    return await get_server(server).batch(commands, priority)
+
+async def broadcast_rcon_command(command: str, priority=INTERACTIVE):
     """
-    Allows you to send an RCON command asynchronously.
-    We'll run the blocking MCRcon call in a thread executor,
-    so it doesn't block our async bot.
+    Sends one command to every server at once, so the wall-clock cost is
+    that of the slowest server, not the sum.
+    Returns {server_id: response or None}.
     """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _send_rcon_blocking, command)
+    results = await asyncio.gather(*(server.command(command, priority) for server in servers.values()))
+    return dict(zip(servers, results))
 
-def _send_rcon_blocking(command: str):
+def _command_name(command: str):
     """
-    Blocking RCON call: 
-    Connects to the server, sends command, disconnects.
-    Returns the server's response if successful, or None if it fails.
+    The verb of an RCON command ("/waterquality"), used as a metric label.
     """
-    try:
-        with MCRcon(RCON_HOST, RCON_PASSWORD, port=RCON_PORT) as mcr:
-            response = mcr.command(command)
-            return response
-    except Exception as e:
-        print(f"[RCON ERROR] Failed to send '{command}': {e}")
-        return None
+    parts = command.split(maxsplit=1)
+    return parts[0] if parts else ""
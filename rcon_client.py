@@ -0,0 +1,239 @@
+import asyncio
+import itertools
+import struct
+
+RCON_TIMEOUT = 5  # seconds, applies to connect, auth and each response
+
+SERVERDATA_RESPONSE_VALUE = 0
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_AUTH = 3
+
+class RconAuthError(Exception):
+    pass
+
+def encode_packet(request_id, packet_type, body):
+    """
+    Source RCON packet: little-endian int32 size, id and type,
+    then the body followed by two null bytes.
+    """
+    payload = struct.pack("<ii", request_id, packet_type) + body.encode("utf8") + b"\x00\x00"
+    return struct.pack("<i", len(payload)) + payload
+
+async def read_packet(reader):
+    """
+    Reads one packet from the stream and returns (request_id, type, body).
+    """
+    (length,) = struct.unpack("<i", await reader.readexactly(4))
+    payload = await reader.readexactly(length)
+    request_id, packet_type = struct.unpack("<ii", payload[:8])
+    return request_id, packet_type, payload[8:-2].decode("utf8", errors="replace")
+
+class _Connection:
+    """
+    One authenticated socket plus the requests still waiting on it.
+    Keeping pending futures per connection means a dying connection only
+    fails its own requests, never ones already sent on its replacement.
+    `parts` collects each command's response packets and `sentinels` maps
+    a sentinel's id back to the command it follows.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.parts = {}
+        self.sentinels = {}
+        self.read_task = None
+        self.closed = False
+
+    def forget(self, request_id, sentinel_id):
+        self.pending.pop(request_id, None)
+        self.parts.pop(request_id, None)
+        self.sentinels.pop(sentinel_id, None)
+
+    def close(self, error):
+        if self.closed:
+            return
+        self.closed = True
+        self.writer.close()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+        self.parts.clear()
+        self.sentinels.clear()
+
+class AsyncRconClient:
+    """
+    Pure-asyncio Source RCON client.
+    All commands share one socket: each request gets its own id, and a
+    background reader resolves the matching future when the response
+    arrives, so any number of commands can be in flight without threads.
+
+    Long responses arrive split over several packets with no marker on
+    the last one, so every command is followed by an empty
+    SERVERDATA_RESPONSE_VALUE sentinel. The server answers packets in
+    order and mirrors the sentinel back, so its echo means every part of
+    the command's response is in and they can be joined.
+    """
+    def __init__(self, host, port, password, timeout=RCON_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._conn = None
+        self._connect_lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+        self.connections_opened = 0
+
+    def _next_id(self):
+        # Ids are positive int32s; -1 is reserved for a failed auth reply
+        return next(self._ids) % 0x7FFFFFFF or next(self._ids)
+
+    @property
+    def connected(self):
+        return self._conn is not None and not self._conn.closed
+
+    async def _get_connection(self):
+        if self.connected:
+            return self._conn
+        async with self._connect_lock:
+            if self.connected:
+                return self._conn
+            self._conn = await asyncio.wait_for(self._open(), self.timeout)
+            return self._conn
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            auth_id = self._next_id()
+            writer.write(encode_packet(auth_id, SERVERDATA_AUTH, self.password))
+            await writer.drain()
+            while True:
+                request_id, packet_type, _ = await read_packet(reader)
+                # Servers send an empty RESPONSE_VALUE ahead of the auth reply
+                if packet_type != SERVERDATA_AUTH_RESPONSE:
+                    continue
+                if request_id == -1:
+                    raise RconAuthError("RCON authentication failed")
+                if request_id == auth_id:
+                    break
+        except BaseException:
+            writer.close()
+            raise
+
+        conn = _Connection(reader, writer)
+        conn.read_task = asyncio.create_task(self._read_loop(conn))
+        self.connections_opened += 1
+        return conn
+
+    async def _read_loop(self, conn):
+        error = ConnectionError("RCON connection closed")
+        try:
+            while True:
+                request_id, _, body = await read_packet(conn.reader)
+                command_id = conn.sentinels.pop(request_id, None)
+                if command_id is not None:
+                    future = conn.pending.pop(command_id, None)
+                    parts = conn.parts.pop(command_id, [])
+                    if future is not None and not future.done():
+                        future.set_result("".join(parts))
+                elif request_id in conn.pending:
+                    conn.parts.setdefault(request_id, []).append(body)
+                # Anything else is the trailing packet some servers send
+                # after a sentinel's echo, or a reply nobody waits for
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = ConnectionError(f"RCON connection lost: {e!r}")
+        finally:
+            conn.close(error)
+
+    def _register(self, conn, count):
+        loop = asyncio.get_running_loop()
+        requests = []
+        for _ in range(count):
+            request_id = self._next_id()
+            sentinel_id = self._next_id()
+            future = loop.create_future()
+            conn.pending[request_id] = future
+            conn.sentinels[sentinel_id] = request_id
+            requests.append((request_id, sentinel_id, future))
+        return requests
+
+    async def _send(self, conn, requests, commands):
+        conn.writer.write(b"".join(
+            encode_packet(request_id, SERVERDATA_EXECCOMMAND, command)
+            + encode_packet(sentinel_id, SERVERDATA_RESPONSE_VALUE, "")
+            for (request_id, sentinel_id, _), command in zip(requests, commands)
+        ))
+        await conn.writer.drain()
+
+    async def command(self, command: str):
+        """
+        Sends one command and waits for its response.
+        If a reused connection turns out to be dead on write, the command is
+        retried once on a fresh connection. Raises on failure.
+        """
+        for attempt in range(2):
+            conn = await self._get_connection()
+            [(request_id, sentinel_id, future)] = requests = self._register(conn, 1)
+            try:
+                await self._send(conn, requests, [command])
+            except ConnectionError as e:
+                conn.forget(request_id, sentinel_id)
+                conn.close(e)
+                if attempt == 0:
+                    continue
+                raise
+            break
+
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # An unanswered request usually means a half-open socket
+            conn.close(ConnectionError("RCON response timed out"))
+            raise
+        finally:
+            conn.forget(request_id, sentinel_id)
+
+    async def batch(self, commands):
+        """
+        Writes every command in one go and waits for all responses.
+        Returns a list in command order holding either the response text or
+        the exception for that command. Nothing is retried, since a command
+        that got no answer may still have run on the server.
+        """
+        commands = list(commands)
+        if not commands:
+            return []
+        try:
+            conn = await self._get_connection()
+        except Exception as e:
+            return [e] * len(commands)
+
+        requests = self._register(conn, len(commands))
+        try:
+            await self._send(conn, requests, commands)
+            done, _ = await asyncio.wait([f for _, _, f in requests], timeout=self.timeout)
+            if len(done) < len(requests):
+                conn.close(ConnectionError("RCON response timed out"))
+        except ConnectionError as e:
+            conn.close(e)
+
+        results = []
+        for request_id, sentinel_id, future in requests:
+            conn.forget(request_id, sentinel_id)
+            if future.done() and not future.cancelled():
+                results.append(future.exception() or future.result())
+            else:
+                future.cancel()
+                results.append(ConnectionError("RCON response timed out"))
+        return results
+
+    async def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close(ConnectionError("RCON client closed"))
+            if conn.read_task is not None:
+                conn.read_task.cancel()
@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import itertools
+import clock
+import metrics
+from storage import get_schedule, set_schedule
+
+MAX_RETRY_DELAY = 15 * 60  # seconds; cap for re-running a job that crashed
+
+class _Job:
+    def __init__(self, name, callback, interval=None, offset=0, kind=None, payload=None):
+        self.name = name
+        self.callback = callback
+        self.interval = interval      # None for one-shot jobs
+        self.offset = offset
+        self.kind = kind              # one-shot handler name, persisted
+        self.payload = payload
+        self.next_fire = None
+        self.failures = 0
+        self.running = None
+        self.cancelled = False
+
+    @property
+    def periodic(self):
+        return self.interval is not None
+
+    def next_aligned(self, after):
+        """
+        Next wall-clock multiple of the interval (plus offset) after `after`,
+        so a 20-minute job always fires at :00, :20 and :40.
+        """
+        fire = (after - self.offset) // self.interval * self.interval + self.offset
+        while fire <= after:
+            fire += self.interval
+        return fire
+
+class Scheduler:
+    """
+    One heap of timers for every periodic job and one-shot deadline.
+    Periodic jobs fire on wall-clock boundaries rather than "sleep after
+    each run", so they never drift. Next-fire times are persisted: after a
+    restart a job that missed its slot runs once straight away (missed
+    runs are coalesced), and one-shot deadlines such as a weather pause
+    expiry survive deploys. A job that raises is retried with backoff.
+    """
+    def __init__(self):
+        self._heap = []
+        self._jobs = {}
+        self._handlers = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._stored = None
+
+    def _stored_schedule(self):
+        """
+        The schedule as persisted by the previous process, read once before
+        any registration here overwrites it.
+        """
+        if self._stored is None:
+            self._stored = get_schedule()
+        return self._stored
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    # --- Registration ---
+
+    def add_periodic(self, name, interval, callback, offset=0):
+        """
+        Runs `callback()` every `interval` seconds, aligned to wall-clock time.
+        A job with no stored next-fire time, or one whose slot passed while
+        the bot was down, runs once immediately.
+        """
+        job = _Job(name, callback, interval=interval, offset=offset)
+        stored = self._stored_schedule().get(name)
+        now = clock.time()
+        if stored and stored.get("next", 0) > now:
+            job.next_fire = min(stored["next"], job.next_aligned(now))
+        else:
+            job.next_fire = now
+        self._add(job)
+
+    def register_handler(self, kind, callback):
+        """
+        Registers the coroutine function that runs one-shot deadlines of
+        this kind; it is called with the deadline's payload.
+        """
+        self._handlers[kind] = callback
+
+    def schedule_at(self, name, when, kind, payload=None):
+        """
+        Sets (or replaces) a persisted one-shot deadline at unix time `when`.
+        """
+        self.cancel(name)
+        job = _Job(name, self._handlers[kind], kind=kind, payload=payload)
+        job.next_fire = when
+        self._add(job)
+
+    def cancel(self, name):
+        job = self._jobs.pop(name, None)
+        if job is None:
+            return False
+        job.cancelled = True
+        self._persist()
+        return True
+
+    def next_fire(self, name):
+        job = self._jobs.get(name)
+        return job.next_fire if job else None
+
+    def restore(self):
+        """
+        Re-creates persisted one-shot deadlines. Handlers must be registered
+        first; deadlines that passed while the bot was down fire at once.
+        """
+        for name, entry in self._stored_schedule().items():
+            kind = entry.get("kind")
+            if not kind or name in self._jobs:
+                continue
+            if kind not in self._handlers:
+                print(f"[Scheduler] No handler for stored deadline '{name}' ({kind}), dropping it.")
+                continue
+            job = _Job(name, self._handlers[kind], kind=kind, payload=entry.get("payload"))
+            job.next_fire = entry["next"]
+            self._add(job)
+        self._persist()
+
+    def _add(self, job):
+        self._jobs[job.name] = job
+        heapq.heappush(self._heap, (job.next_fire, next(self._seq), job))
+        self._persist()
+        self._wakeup.set()
+
+    def _persist(self):
+        schedule = {}
+        for job in self._jobs.values():
+            entry = {"next": job.next_fire}
+            if job.kind:
+                entry["kind"] = job.kind
+                entry["payload"] = job.payload
+            schedule[job.name] = entry
+        set_schedule(schedule)
+
+    # --- Running ---
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._supervise)
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _supervise(self, task):
+        if self._stopping or task.cancelled():
+            return
+        error = task.exception()
+        print(f"[Scheduler] Scheduler loop died ({error!r}); restarting it.")
+        self._task = None
+        self.start()
+
+    def _peek(self):
+        """
+        The next live heap entry's job, dropping entries for jobs that were
+        cancelled or rescheduled. None when nothing is scheduled.
+        """
+        while self._heap:
+            fire, _, job = self._heap[0]
+            if job.cancelled or self._jobs.get(job.name) is not job or fire != job.next_fire:
+                heapq.heappop(self._heap)
+                continue
+            return job
+        return None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if self._peek() is None:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - clock.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, job = heapq.heappop(self._heap)
+            self._fire(job)
+
+    async def advance_to(self, until, settle=None):
+        """
+        Simulation driver, used instead of start() with a VirtualClock:
+        jumps the clock to each deadline up to `until` in order, fires it
+        and waits for the job (and `settle()`, if given) to finish before
+        moving on. Leaves the clock at `until`.
+        """
+        while True:
+            job = self._peek()
+            if job is None or job.next_fire > until:
+                break
+            clock.current().set(max(clock.time(), job.next_fire))
+            heapq.heappop(self._heap)
+            self._fire(job)
+            if job.running is not None:
+                await asyncio.gather(job.running, return_exceptions=True)
+            if settle is not None:
+                await settle()
+        clock.current().set(max(clock.time(), until))
+
+    def _fire(self, job):
+        now = clock.time()
+        if job.running is not None and not job.running.done():
+            # Still busy with the previous run: skip this slot
+            print(f"[Scheduler] '{job.name}' is still running, skipping this run.")
+        else:
+            job.running = asyncio.create_task(self._run_job(job))
+
+        if job.periodic:
+            job.next_fire = job.next_aligned(now)
+            heapq.heappush(self._heap, (job.next_fire, next(self._seq), job))
+        else:
+            self._jobs.pop(job.name, None)
+        self._persist()
+
+    async def _run_job(self, job):
+        try:
+            with metrics.time_loop(job.name):
+                if job.periodic:
+                    await job.callback()
+                else:
+                    await job.callback(job.payload)
+            job.failures = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            delay = min(MAX_RETRY_DELAY, 30 * 2 ** (job.failures - 1))
+            print(f"[Scheduler] '{job.name}' failed ({job.failures}x): {e!r}; retrying in {delay}s.")
+            if job.cancelled:
+                return
+            if job.periodic:
+                # Retry before the next regular slot if that is further away
+                retry = clock.time() + delay
+                if retry < job.next_fire:
+                    job.next_fire = retry
+                    heapq.heappush(self._heap, (retry, next(self._seq), job))
+                    self._wakeup.set()
+            else:
+                job.next_fire = clock.time() + delay
+                self._add(job)
+            self._persist()
+
+scheduler = Scheduler()
@@ -1,8 +1,16 @@
+import asyncio
 import discord
 import datetime
-from config import CHANNEL_IDS
-from storage import get_last_season, set_last_season
+import clock
+import metrics
+from config import CHANNEL_IDS, SEASON_ANCHOR
+from storage import (
+    get_last_season, set_last_season, record_season,
+    get_season_anchor, set_season_anchor
+)
 from logger import log_to_discord
+from scheduler import scheduler
+from events import bus, SeasonChanged
 
 SEASON_LENGTH_DAYS = 14
 
@@ -68,121 +76,268 @@ SEASON_DATA = {
     }
 }
 
+_season_cache = None
+
+class SeasonChangeError(Exception):
+    """
+    Raised when a season change could not post to #season; `errors` maps
+    each failed step to its exception.
+    """
+    def __init__(self, season_name, errors):
+        super().__init__(f"Season change to {season_name} failed: {', '.join(errors)}")
+        self.errors = errors
+
+def _to_timestamp(dt):
+    return dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+def season_at(when, anchor):
+    """
+    Pure O(1) season lookup: `anchor` is the start of a Blooming and the
+    seasons repeat every SEASON_LENGTH_DAYS in SEASONS order.
+    Returns (season, start, end).
+    """
+    length = datetime.timedelta(days=SEASON_LENGTH_DAYS)
+    elapsed = (when - anchor) // length
+    start = anchor + elapsed * length
+    return SEASONS[elapsed % len(SEASONS)], start, start + length
+
+def anchor_for(season_name, start):
+    """
+    The anchor that makes `season_name` start at `start`.
+    """
+    return start - SEASONS.index(season_name) * datetime.timedelta(days=SEASON_LENGTH_DAYS)
+
+def season_anchor():
+    """
+    The stored anchor, else SEASON_ANCHOR from config, else one derived
+    from the last recorded season (or from now, if there is none). The
+    result is stored so boundaries never move between restarts.
+    """
+    anchor = get_season_anchor() or SEASON_ANCHOR
+    if anchor:
+        if not get_season_anchor():
+            set_season_anchor(anchor)
+        return datetime.datetime.fromisoformat(anchor)
+
+    last = get_last_season()
+    if last and last.get("season") in SEASONS:
+        anchor_dt = anchor_for(last["season"], datetime.datetime.fromisoformat(last["start"]))
+    else:
+        anchor_dt = clock.utcnow()
+    set_season_anchor(anchor_dt.isoformat())
+    return anchor_dt
+
+def current_season(now=None):
+    """
+    Returns {"season", "start", "end"} (ISO strings) for `now`, cached
+    until the season's end so callers never touch storage in between.
+    """
+    global _season_cache
+    now = now or clock.utcnow()
+    if _season_cache is not None:
+        start = datetime.datetime.fromisoformat(_season_cache["start"])
+        end = datetime.datetime.fromisoformat(_season_cache["end"])
+        if start <= now < end:
+            return dict(_season_cache)
+
+    season, start, end = season_at(now, season_anchor())
+    _season_cache = {"season": season, "start": start.isoformat(), "end": end.isoformat()}
+    return dict(_season_cache)
+
+def _reset_season_cache():
+    global _season_cache
+    _season_cache = None
+
 class SeasonManager:
     def __init__(self, bot):
         self.bot = bot
 
     async def check_season_change(self):
         """
-        If no stored season or 14+ days have passed since last start,
-        move to the next season. Otherwise do nothing.
+        Computes the season in effect right now and applies it if it
+        differs from the last one announced. After any amount of downtime
+        this jumps straight to the right season in one call.
         """
+        current = current_season()
         last = get_last_season()
-        now = datetime.datetime.utcnow()
-
-        if last:
-            start = datetime.datetime.fromisoformat(last["start"])
-            if (now - start).days < SEASON_LENGTH_DAYS:
-                # Not enough days have passed
-                return
+        if last and (last.get("season"), last.get("start")) == (current["season"], current["start"]):
+            return
 
-            # Rotate to next season in SEASONS list
-            last_index = SEASONS.index(last["season"])
-            new_index = (last_index + 1) % len(SEASONS)
-        else:
-            # If no previous season is saved, start at index 0
-            new_index = 0
+        start = datetime.datetime.fromisoformat(current["start"])
+        await self.apply_season_change(current["season"], start)
 
-        new_season = SEASONS[new_index]
-        await self.apply_season_change(new_season, now)
+    async def run_boundary(self, payload=None):
+        """
+        Scheduler handler: checks the season, then sleeps exactly until the
+        current season ends.
+        """
+        try:
+            await self.check_season_change()
+        finally:
+            end = datetime.datetime.fromisoformat(current_season()["end"])
+            scheduler.schedule_at("season", _to_timestamp(end), "season_boundary")
 
     async def manual_set_season(self, season_name):
         """
         Allows an admin to force the season via slash command or direct call.
+        The anchor is moved so the forced season starts now and the normal
+        rotation continues from it.
         """
-        now = datetime.datetime.utcnow()
+        now = clock.utcnow()
         if season_name not in SEASONS:
             raise ValueError("Unknown season.")
+        set_season_anchor(anchor_for(season_name, now).isoformat())
+        _reset_season_cache()
         await self.apply_season_change(season_name, now)
+        end = datetime.datetime.fromisoformat(current_season()["end"])
+        scheduler.schedule_at("season", _to_timestamp(end), "season_boundary")
 
     async def apply_season_change(self, season_name, timestamp):
         """
-        Applies all season updates:
-          1. Check if we've already posted this season recently
-          2. Clean old bot messages in #season
-          3. Post banner + narrative to #season
-          4. Post short announcement in #announcements
-          5. Rename channel with the new season emoji
-          6. Save the new season to storage
-          7. Log to #twh-bot-logs
+        Applies all season updates in four round trips:
+          1. Fetch recent #season history once: skip if this season is
+             already posted, otherwise collect our old posts
+          2. Concurrently: delete old posts (bulk where Discord allows),
+             post banner + narrative to #season, rename the channel
+          3. Once the #season post is in, post and publish the announcement
+          4. Save the new season to storage, publish SeasonChanged and
+             log to #twh-bot-logs
+        Failures of individual steps are collected and reported together.
+        If the #season post fails the change is retried, so nothing that
+        would be repeated by the retry (the announcement) is sent first.
         """
         season_channel = self.bot.get_channel(CHANNEL_IDS["season"])
         announcements = self.bot.get_channel(CHANNEL_IDS["announcements"])
 
+        try:
+            recent = [msg async for msg in season_channel.history(limit=5)]
+        except Exception as e:
+            print("Failed to read season channel history:", e)
+            recent = []
+        own_posts = [msg for msg in recent if msg.author == self.bot.user]
+
         # Skip if we already posted this season
-        if await self.check_already_posted(season_channel, season_name):
+        if self.check_already_posted(own_posts, season_name):
             print(f"Skipping re-post: the channel already has {season_name}.")
+            set_last_season({
+                "season": season_name,
+                "start": timestamp.isoformat()
+            })
             return
 
         data = SEASON_DATA[season_name]
 
-        # Clean up old season posts by our bot
-        try:
-            async for msg in season_channel.history(limit=5):
-                if msg.author == self.bot.user:
-                    await msg.delete()
-        except Exception as e:
-            print("Failed to clean season messages:", e)
-
         # Format timestamps
         start_ts = discord.utils.format_dt(timestamp, style='F')
         end_time = timestamp + datetime.timedelta(days=SEASON_LENGTH_DAYS)
         end_ts = discord.utils.format_dt(end_time, style='F')
         end_rel = discord.utils.format_dt(end_time, style='R')
 
-        # Post banner + narrative
-        await season_channel.send(data["banner_url"])
         narrative_msg = (
             f"{data['narrative']}\n\n"
             f"This season began {start_ts} and ends {end_ts} {end_rel}."
         )
-        await season_channel.send(narrative_msg)
-
         # Short announcement embed
         embed = discord.Embed(
             description=data["announcement"],
             color=discord.Color.green()
         )
-        ann_msg = await announcements.send(embed=embed)
-        # Try to publish if it's a News channel
-        try:
-            await ann_msg.publish()
-        except Exception:
-            pass  # Not a News channel, ignore
 
-        # Rename channel
-        try:
-            await season_channel.edit(name=f"{data['emoji']}season{data['emoji']}")
-        except Exception as e:
-            print("Failed to rename channel:", e)
+        steps = {
+            "clean": self.delete_posts(season_channel, own_posts),
+            "post": self.post_season(season_channel, data["banner_url"], narrative_msg),
+            "rename": season_channel.edit(name=f"{data['emoji']}season{data['emoji']}"),
+        }
+        results = await asyncio.gather(*steps.values(), return_exceptions=True)
+        errors = {
+            step: result for step, result in zip(steps, results)
+            if isinstance(result, Exception)
+        }
+        if "post" not in errors:
+            try:
+                await self.post_announcement(announcements, embed)
+            except Exception as e:
+                errors["announce"] = e
+
+        if errors:
+            summary = "; ".join(f"{step}: {error}" for step, error in errors.items())
+            print(f"Season change to {season_name} had errors: {summary}")
+            await log_to_discord(self.bot, f"Season change to {season_name} had errors: {summary}")
+        if "post" in errors:
+            # Nothing landed in #season; leave the season unrecorded so the
+            # scheduler retries the change
+            raise SeasonChangeError(season_name, errors)
 
         # Record the new season
+        previous = get_last_season()
         set_last_season({
             "season": season_name,
             "start": timestamp.isoformat()
         })
+        record_season(season_name, timestamp.isoformat())
+        bus.publish(SeasonChanged(
+            season=season_name,
+            start=timestamp.isoformat(),
+            end=end_time.isoformat(),
+            previous=previous["season"] if previous else None
+        ))
 
         await log_to_discord(self.bot, f"Season changed to {season_name}")
 
-    async def check_already_posted(self, season_channel, season_name):
+    async def delete_posts(self, channel, messages):
+        """
+        Deletes our old season posts. Discord only bulk-deletes messages
+        younger than 14 days, which a finished season's posts usually are
+        not, so older ones are deleted individually (concurrently). Bulk
+        delete also needs Manage Messages; without it those are deleted
+        one by one too.
+        """
+        cutoff = clock.utcnow().replace(tzinfo=datetime.timezone.utc) - datetime.timedelta(days=14) + datetime.timedelta(minutes=5)
+        bulk = [msg for msg in messages if msg.created_at > cutoff]
+        single = [msg for msg in messages if msg.created_at <= cutoff]
+        if len(bulk) < 2:
+            single += bulk
+            bulk = []
+
+        deletions = [msg.delete() for msg in single]
+        if bulk:
+            deletions.append(self.bulk_delete(channel, bulk))
+        for result in await asyncio.gather(*deletions, return_exceptions=True):
+            if isinstance(result, Exception):
+                raise result
+
+    async def bulk_delete(self, channel, messages):
+        try:
+            await channel.delete_messages(messages)
+        except discord.Forbidden:
+            # No Manage Messages: the bot can still delete its own posts
+            await asyncio.gather(*(msg.delete() for msg in messages))
+
+    async def post_season(self, channel, banner_url, narrative_msg):
+        # Banner first, narrative second: these two must stay in order
+        with metrics.DISCORD_SEND_SECONDS.time(kind="season"):
+            await channel.send(banner_url)
+            await channel.send(narrative_msg)
+
+    async def post_announcement(self, channel, embed):
+        with metrics.DISCORD_SEND_SECONDS.time(kind="announcement"):
+            ann_msg = await channel.send(embed=embed)
+        # Try to publish if it's a News channel
+        try:
+            await ann_msg.publish()
+        except Exception:
+            pass  # Not a News channel, ignore
+
+    def check_already_posted(self, own_posts, season_name):
         """
-        Checks the recent bot messages in #season 
-        to see if there's already an announcement for this season.
-        If we find a mention of the same season, we skip re-posting.
+        Checks our recent messages in #season to see if there's already
+        an announcement for this season.
+        If we find this season's narrative, we skip re-posting. (Matching
+        the season's name is not enough: the Drought narrative mentions
+        The Brightening.)
         """
-        async for msg in season_channel.history(limit=5):
-            if msg.author == self.bot.user:
-                # Check if the message text references this season's name
-                if season_name.lower() in msg.content.lower():
-                    return True
+        narrative = SEASON_DATA[season_name]["narrative"]
+        for msg in own_posts:
+            if msg.content.startswith(narrative):
+                return True
         return False
@@ -0,0 +1,287 @@
+"""
+Offline, time-accelerated run of the season/weather/water cycle.
+
+Runs the real SeasonManager, WeatherManager and WaterManager on a
+VirtualClock against FakeRconServers and an in-memory Discord stand-in.
+The scheduler is stepped from deadline to deadline instead of sleeping,
+so a 56-day, four-season year takes seconds. Reports RCON commands and
+Discord messages per scheduled run, and every rule violation found in
+what was actually applied.
+
+    python simulation.py --days 56 --servers 2 --seed 1
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+
+PASSWORD = "simulation"
+START = datetime.datetime(2026, 1, 1)
+
+class FakeMessage:
+    def __init__(self, channel, content, embed, author, created_at):
+        self.channel = channel
+        self.content = content or ""
+        self.embed = embed
+        self.author = author
+        self.created_at = created_at
+
+    async def delete(self):
+        self.channel.remove([self])
+
+    async def publish(self):
+        self.channel.published += 1
+
+class FakeChannel:
+    """Keeps what was posted and counts every Discord call made on it."""
+    def __init__(self, name, bot):
+        self.name = name
+        self.bot = bot
+        self.messages = []
+        self.sent = 0
+        self.deleted = 0
+        self.published = 0
+        self.edits = 0
+
+    async def send(self, content=None, embed=None, **kwargs):
+        import clock
+        created_at = clock.utcnow().replace(tzinfo=datetime.timezone.utc)
+        message = FakeMessage(self, content, embed, self.bot.user, created_at)
+        self.messages.append(message)
+        self.sent += 1
+        return message
+
+    async def history(self, limit=100):
+        for message in reversed(self.messages[-limit:]):
+            yield message
+
+    async def delete_messages(self, messages):
+        self.remove(messages)
+
+    def remove(self, messages):
+        for message in messages:
+            if message in self.messages:
+                self.messages.remove(message)
+                self.deleted += 1
+
+    async def edit(self, name=None, **kwargs):
+        self.name = name or self.name
+        self.edits += 1
+
+class FakeBot:
+    def __init__(self, channel_ids):
+        self.user = "twh-bot"
+        self.channels = {channel_id: FakeChannel(name, self) for name, channel_id in channel_ids.items()}
+        self.by_name = {channel.name: channel for channel in self.channels.values()}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def calls(self, exclude=()):
+        return sum(
+            channel.sent + channel.edits + channel.published + channel.deleted
+            for name, channel in self.by_name.items() if name not in exclude
+        )
+
+def water_levels(server):
+    """{source: quality} as last set on a FakeRconServer."""
+    levels = {}
+    for command in server.commands:
+        parts = command.split()
+        if parts[0] == "/waterquality":
+            levels[parts[1]] = int(parts[2])
+    return levels
+
+def check_weather(rows, season_at, anchor, rules, interval):
+    """
+    Checks the applied weather history: every tick present, every weather
+    allowed in its season and the season right, no third rain/storm in a
+    row in Blooming, rains in Brightening at least 6 hours apart.
+    """
+    from weather_manager import WET_WEATHER, BLOOMING_MAX_WET_STREAK, BRIGHTENING_RAIN_SPACING
+
+    violations = []
+    streak = 0
+    last_rain = None
+    previous = None
+    for ts, weather, season in rows:
+        when = datetime.datetime.utcfromtimestamp(ts)
+        stamp = when.strftime("%m-%d %H:%M")
+        expected_season = season_at(when, anchor)[0]
+        if season != expected_season:
+            violations.append(f"{stamp} weather recorded for {season}, but it is {expected_season}")
+        if weather not in rules.get(season, []):
+            violations.append(f"{stamp} {weather} is not allowed in {season}")
+        if previous is not None and ts - previous[0] > interval * 1.5:
+            violations.append(f"{stamp} no weather for {(ts - previous[0]) / 60:.0f} minutes")
+        if previous is None or previous[2] != season:
+            streak = 0
+            last_rain = None
+
+        streak = streak + 1 if weather in WET_WEATHER else 0
+        if season == "The Blooming" and streak > BLOOMING_MAX_WET_STREAK:
+            violations.append(f"{stamp} {streak} rain/storm ticks in a row in The Blooming")
+        if weather == "rain":
+            if season == "The Brightening" and last_rain is not None \
+                    and when - last_rain < BRIGHTENING_RAIN_SPACING:
+                violations.append(f"{stamp} rain {(when - last_rain).total_seconds() / 3600:.1f}h after the last one in The Brightening")
+            last_rain = when
+        previous = (ts, weather, season)
+    return violations
+
+async def run(args):
+    from fake_rcon import FakeRconServer
+
+    random.seed(args.seed)
+    workdir = tempfile.TemporaryDirectory(prefix="twh-sim-")
+    rcon_servers = [await FakeRconServer(password=PASSWORD).start() for _ in range(args.servers)]
+
+    # config.py reads these at import time, so set them before the bot's
+    # modules are imported; the state and history live in a scratch db
+    os.environ["RCON_SERVERS"] = json.dumps([
+        {"id": f"server{i + 1}", "host": server.host, "port": server.port, "password": PASSWORD}
+        for i, server in enumerate(rcon_servers)
+    ])
+    os.environ["STORAGE_DB"] = os.path.join(workdir.name, "simulation.db")
+    os.environ["SEASON_ANCHOR"] = START.isoformat()
+    os.chdir(workdir.name)
+
+    import clock
+    virtual = clock.VirtualClock(START)
+    clock.use(virtual)
+
+    from config import CHANNEL_IDS, WATER_TRANSITION_BUDGET
+    from events import bus
+    from logger import get_log_sink, LOG_FLUSH_INTERVAL
+    from scheduler import scheduler
+    from season_manager import SeasonManager, season_at, SEASONS, SEASON_DATA, SEASON_LENGTH_DAYS
+    from weather_manager import WeatherManager, SEASON_WEATHER_RULES, WEATHER_INTERVAL
+    from water_manager import WaterManager
+    from storage import get_weather_history, get_season_history
+    import rcon
+
+    bot = FakeBot(CHANNEL_IDS)
+    season_manager = SeasonManager(bot)
+    weather_manager = WeatherManager(bot)
+    water_manager = WaterManager()
+
+    runs = collections.defaultdict(list)   # job -> [(rcon commands, discord calls)]
+    violations = []
+
+    def rcon_total():
+        return sum(len(server.commands) for server in rcon_servers)
+
+    def counted(job, callback):
+        """
+        Wraps a scheduled callback to count what one run (including the
+        event handlers it triggers) sent to RCON and Discord.
+        """
+        async def run_job(*payload):
+            if job == "season" and clock.time() > start:
+                # The outgoing season's water ramp must have finished by now
+                check_water(season_at(clock.utcnow() - datetime.timedelta(seconds=1), START)[0])
+            rcon_before = rcon_total()
+            discord_before = bot.calls(exclude=("bot_logs",))
+            await callback(*payload)
+            await bus.drain()
+            runs[job].append((rcon_total() - rcon_before, bot.calls(exclude=("bot_logs",)) - discord_before))
+            if job == "season":
+                check_season_change()
+        return run_job
+
+    def check_season_change():
+        season = season_at(clock.utcnow(), START)[0]
+        stamp = clock.utcnow().strftime("%m-%d %H:%M")
+        channel = bot.by_name["season"]
+        if len(channel.messages) != 2:
+            violations.append(f"{stamp} #season holds {len(channel.messages)} messages after the change, expected 2")
+        if not channel.messages or not channel.messages[-1].content.startswith(SEASON_DATA[season]["narrative"]):
+            violations.append(f"{stamp} #season does not describe {season}")
+
+    def check_water(season):
+        """Water levels on every fake server match what `season` wants."""
+        stamp = clock.utcnow().strftime("%m-%d %H:%M")
+        desired = water_manager.desired_quality(season)
+        for i, server in enumerate(rcon_servers):
+            levels = water_levels(server)
+            wrong = [source for source, quality in desired.items() if levels.get(source) != quality]
+            if wrong:
+                violations.append(f"{stamp} server{i + 1}: {len(wrong)} water sources not at {season} levels")
+
+    # Same jobs as main.start_scheduler
+    scheduler.register_handler("season_boundary", counted("season", season_manager.run_boundary))
+    scheduler.add_periodic("weather", weather_manager.weather_interval, counted("weather", weather_manager.run_tick))
+    scheduler.add_periodic("water", water_manager.interval, counted("water", water_manager.apply_water_logic))
+    scheduler.add_periodic("water_transition", water_manager.transition_step,
+                           counted("water_transition", water_manager.run_transition_tick))
+    scheduler.schedule_at("season", clock.time(), "season_boundary")
+
+    start = clock.time()
+    wall_start = time.perf_counter()
+    end = clock.time() + args.days * 24 * 60 * 60
+    await scheduler.advance_to(end, settle=bus.drain)
+    elapsed = time.perf_counter() - wall_start
+
+    # Let the log sink send what it has buffered
+    await asyncio.sleep(LOG_FLUSH_INTERVAL + 0.5)
+    sink = get_log_sink(bot)
+
+    weather_rows = get_weather_history(0)
+    violations += check_weather(weather_rows, season_at, START, SEASON_WEATHER_RULES, WEATHER_INTERVAL)
+
+    ramp_max = max((r for r, _ in runs["water_transition"]), default=0)
+    if ramp_max > WATER_TRANSITION_BUDGET * args.servers:
+        violations.append(f"a water ramp step sent {ramp_max} RCON commands, budget is {WATER_TRANSITION_BUDGET} per server")
+
+    seasons = list(reversed(get_season_history(limit=1000)))
+    # The run includes its last instant, so a boundary there counts too
+    expected_seasons = args.days // SEASON_LENGTH_DAYS + 1
+    if len(seasons) != expected_seasons:
+        violations.append(f"{len(seasons)} season changes recorded, expected {expected_seasons}")
+    for i, (_, season, start) in enumerate(seasons):
+        if season != SEASONS[i % len(SEASONS)]:
+            violations.append(f"season change {i + 1} was {season}, expected {SEASONS[i % len(SEASONS)]}")
+        expected_start = START + datetime.timedelta(days=i * SEASON_LENGTH_DAYS)
+        if datetime.datetime.fromisoformat(start) != expected_start:
+            violations.append(f"{season} started {start}, expected {expected_start.isoformat()}")
+
+    for server in rcon.servers.values():
+        await server.close()
+    for server in rcon_servers:
+        await server.stop()
+    workdir.cleanup()
+
+    print(f"Simulated {args.days} days on {args.servers} server(s) in {elapsed:.2f} s (seed {args.seed})")
+    print(f"  {'job':<8} {'runs':>6} {'rcon total':>11} {'rcon/run max':>13} {'discord total':>14} {'discord/run max':>16}")
+    for job, samples in sorted(runs.items()):
+        rcon_counts = [r for r, _ in samples]
+        discord_counts = [d for _, d in samples]
+        print(f"  {job:<8} {len(samples):>6} {sum(rcon_counts):>11} {max(rcon_counts):>13} "
+              f"{sum(discord_counts):>14} {max(discord_counts):>16}")
+    print(f"  RCON commands sent    {sum(len(s.commands) for s in rcon_servers)}")
+    print(f"  Discord calls         {bot.calls()} "
+          + ", ".join(f"#{name}: {channel.sent} sent" for name, channel in bot.by_name.items()))
+    print(f"  Log lines             {sink.sent_lines} in {sink.sent_messages} messages ({sink.dropped} dropped)")
+    print(f"  Weather ticks         {len(weather_rows)}")
+    print(f"  Rule violations       {len(violations)}")
+    for violation in violations[:50]:
+        print(f"    - {violation}")
+    if len(violations) > 50:
+        print(f"    ... and {len(violations) - 50} more")
+    return 1 if violations else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the season/weather/water cycle offline on a virtual clock")
+    parser.add_argument("--days", type=int, default=56, help="simulated days (56 = one four-season year)")
+    parser.add_argument("--servers", type=int, default=1, help="fake game servers to drive")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
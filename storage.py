@@ -1,38 +1,398 @@
+import atexit
+import copy
 import json
 import os
+import sqlite3
+import tempfile
+import threading
+import clock
+import metrics
+from config import STORAGE_BACKEND, STORAGE_DB, HISTORY_RETENTION_DAYS
 
 STORAGE_FILE = "data.json"
+FLUSH_DELAY = 1.0  # seconds; writes landing inside this window share one flush
 
-def load_data():
-    if not os.path.exists(STORAGE_FILE):
+def _read_file(path):
+    if not os.path.exists(path):
         return {}
-    with open(STORAGE_FILE, "r") as f:
+    with open(path, "r") as f:
         return json.load(f)
 
+def _atomic_write(path, text):
+    """
+    Writes to a temp file in the same directory, fsyncs it, then renames it
+    over the real file. A crash mid-write leaves the old file intact.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".data-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+class StateStore:
+    """
+    Process-wide, in-memory copy of data.json.
+    The file is read once; reads are served from memory and writes
+    mark the state dirty and schedule a background flush. Every write
+    that lands before that flush runs is carried by the same fsync.
+    """
+    def __init__(self, path=STORAGE_FILE, flush_delay=FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._data = None
+        self._dirty = False
+        self._timer = None
+
+    def _ensure_loaded(self):
+        if self._data is None:
+            self._data = _read_file(self.path)
+
+    def get(self, key, default=None):
+        with metrics.STORAGE_SECONDS.time(op="read"), self._lock:
+            self._ensure_loaded()
+            return copy.deepcopy(self._data.get(key, default))
+
+    def set(self, key, value):
+        with metrics.STORAGE_SECONDS.time(op="write"), self._lock:
+            self._ensure_loaded()
+            self._data[key] = copy.deepcopy(value)
+            self._mark_dirty()
+
+    def snapshot(self):
+        with self._lock:
+            self._ensure_loaded()
+            return copy.deepcopy(self._data)
+
+    def replace(self, data):
+        with self._lock:
+            self._data = copy.deepcopy(data)
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        Writes pending changes to disk now. Safe to call from any thread;
+        concurrent flushes are serialized so an older snapshot can never
+        overwrite a newer one.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                text = json.dumps(self._data, indent=4)
+                self._dirty = False
+            try:
+                with metrics.STORAGE_SECONDS.time(op="flush"):
+                    _atomic_write(self.path, text)
+            except Exception as e:
+                print(f"[STORAGE ERROR] Failed to write {self.path}: {e}")
+                with self._lock:
+                    self._mark_dirty()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS weather_history (
+    ts REAL NOT NULL,
+    weather TEXT NOT NULL,
+    season TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS weather_history_ts ON weather_history (ts);
+CREATE TABLE IF NOT EXISTS season_history (
+    ts REAL NOT NULL,
+    season TEXT NOT NULL,
+    start TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS season_history_ts ON season_history (ts);
+CREATE TABLE IF NOT EXISTS water_history (
+    ts REAL NOT NULL,
+    server TEXT NOT NULL,
+    season TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    sent INTEGER NOT NULL,
+    failed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS water_history_ts ON water_history (ts);
+CREATE TABLE IF NOT EXISTS command_history (
+    ts REAL NOT NULL,
+    server TEXT NOT NULL,
+    username TEXT NOT NULL,
+    command TEXT NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS command_history_ts ON command_history (ts);
+"""
+
+HISTORY_TABLES = ("weather_history", "season_history", "water_history", "command_history")
+
+class Database:
+    """
+    The bot's SQLite file: key/value state for the sqlite backend plus
+    the append-only history tables. WAL mode with synchronous=NORMAL keeps
+    each small commit well under a millisecond, and every query is a
+    fixed SQL string, so sqlite3's statement cache prepares it only once.
+    One connection is shared behind a lock.
+    """
+    def __init__(self, path=STORAGE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return conn.execute(sql, params).rowcount
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class SqliteStateStore:
+    """
+    Same interface as StateStore, backed by the state table. Reads are
+    served from an in-memory copy loaded once; writes go straight through
+    as single-row upserts, so there is nothing to flush.
+    On first use an existing data.json is imported once.
+    """
+    def __init__(self, db, json_path=STORAGE_FILE):
+        self.db = db
+        self.json_path = json_path
+        self._lock = threading.RLock()
+        self._data = None
+
+    def _ensure_loaded(self):
+        if self._data is not None:
+            return
+        rows = self.db.query("SELECT key, value FROM state")
+        self._data = {key: json.loads(value) for key, value in rows}
+        if not self._data and os.path.exists(self.json_path):
+            imported = _read_file(self.json_path)
+            for key, value in imported.items():
+                self._write(key, value)
+            self._data = imported
+            print(f"[STORAGE] Imported {len(imported)} keys from {self.json_path} into {self.db.path}.")
+
+    def _write(self, key, value):
+        self.db.execute(
+            "INSERT INTO state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value)))
+
+    def get(self, key, default=None):
+        with metrics.STORAGE_SECONDS.time(op="read"), self._lock:
+            self._ensure_loaded()
+            return copy.deepcopy(self._data.get(key, default))
+
+    def set(self, key, value):
+        with metrics.STORAGE_SECONDS.time(op="write"), self._lock:
+            self._ensure_loaded()
+            self._data[key] = copy.deepcopy(value)
+            self._write(key, value)
+
+    def snapshot(self):
+        with self._lock:
+            self._ensure_loaded()
+            return copy.deepcopy(self._data)
+
+    def replace(self, data):
+        with self._lock:
+            self._ensure_loaded()
+            self.db.execute("DELETE FROM state")
+            for key, value in data.items():
+                self._write(key, value)
+            self._data = copy.deepcopy(data)
+
+    def flush(self):
+        pass
+
+_db = Database()
+if STORAGE_BACKEND == "json":
+    _state = StateStore()
+else:
+    _state = SqliteStateStore(_db)
+atexit.register(_state.flush)
+atexit.register(_db.close)
+
+def load_data():
+    return _state.snapshot()
+
 def save_data(data):
-    with open(STORAGE_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    _state.replace(data)
+
+def flush():
+    _state.flush()
 
 def get_last_season():
-    return load_data().get("last_season")
+    return _state.get("last_season")
 
 def set_last_season(season_info):
-    data = load_data()
-    data["last_season"] = season_info
-    save_data(data)
+    _state.set("last_season", season_info)
 
 def get_last_weather():
-    return load_data().get("last_weather")
+    return _state.get("last_weather")
 
 def set_last_weather(weather):
-    data = load_data()
-    data["last_weather"] = weather
-    save_data(data)
+    _state.set("last_weather", weather)
 
 def get_pause_state():
-    return load_data().get("pause_weather", False)
+    return _state.get("pause_weather", False)
 
 def set_pause_state(paused):
-    data = load_data()
-    data["pause_weather"] = paused
-    save_data(data)
+    _state.set("pause_weather", paused)
+
+def get_water_state():
+    return _state.get("water_state", {})
+
+def set_water_state(water_state):
+    _state.set("water_state", water_state)
+
+def get_weather_plan():
+    return _state.get("weather_plan")
+
+def set_weather_plan(plan):
+    _state.set("weather_plan", plan)
+
+def get_season_anchor():
+    return _state.get("season_anchor")
+
+def set_season_anchor(anchor):
+    _state.set("season_anchor", anchor)
+
+def get_schedule():
+    return _state.get("schedule", {})
+
+def set_schedule(schedule):
+    _state.set("schedule", schedule)
+
+def get_command_hash():
+    return _state.get("command_hash")
+
+def set_command_hash(command_hash):
+    _state.set("command_hash", command_hash)
+
+# --- History ---
+
+def record_weather(weather, season, ts=None):
+    with metrics.STORAGE_SECONDS.time(op="append"):
+        _db.execute("INSERT INTO weather_history (ts, weather, season) VALUES (?, ?, ?)",
+                    (ts or clock.time(), weather, season))
+
+def record_season(season, start, ts=None):
+    with metrics.STORAGE_SECONDS.time(op="append"):
+        _db.execute("INSERT INTO season_history (ts, season, start) VALUES (?, ?, ?)",
+                    (ts or clock.time(), season, start))
+
+def record_water(server, season, kind, sent, failed, ts=None):
+    with metrics.STORAGE_SECONDS.time(op="append"):
+        _db.execute("INSERT INTO water_history (ts, server, season, kind, sent, failed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (ts or clock.time(), server, season, kind, sent, failed))
+
+def record_command(server, username, command, outcome, ts=None):
+    with metrics.STORAGE_SECONDS.time(op="append"):
+        _db.execute("INSERT INTO command_history (ts, server, username, command, outcome) VALUES (?, ?, ?, ?, ?)",
+                    (ts or clock.time(), server, username, command, outcome))
+
+def get_weather_history(since, until=None):
+    """
+    [(ts, weather, season)] oldest first, for unix times since <= ts < until.
+    """
+    with metrics.STORAGE_SECONDS.time(op="query"):
+        return _db.query("SELECT ts, weather, season FROM weather_history WHERE ts >= ? AND ts < ? ORDER BY ts",
+                         (since, until or float("inf")))
+
+def get_weather_counts(since, until=None):
+    with metrics.STORAGE_SECONDS.time(op="query"):
+        return dict(_db.query("SELECT weather, COUNT(*) FROM weather_history WHERE ts >= ? AND ts < ? "
+                              "GROUP BY weather ORDER BY COUNT(*) DESC", (since, until or float("inf"))))
+
+def get_season_history(limit=10):
+    """
+    [(ts, season, start)] newest first.
+    """
+    with metrics.STORAGE_SECONDS.time(op="query"):
+        return _db.query("SELECT ts, season, start FROM season_history ORDER BY ts DESC LIMIT ?", (limit,))
+
+def get_water_totals(since, until=None):
+    """
+    (runs, commands sent, commands failed) across all servers.
+    """
+    with metrics.STORAGE_SECONDS.time(op="query"):
+        [row] = _db.query("SELECT COUNT(*), COALESCE(SUM(sent), 0), COALESCE(SUM(failed), 0) FROM water_history "
+                          "WHERE ts >= ? AND ts < ?", (since, until or float("inf")))
+    return row
+
+def get_command_counts(since, until=None):
+    """
+    {command: count} of the in-game commands that were let through
+    (outcome 'allowed'), most used first.
+    """
+    with metrics.STORAGE_SECONDS.time(op="query"):
+        return dict(_db.query("SELECT command, COUNT(*) FROM command_history WHERE ts >= ? AND ts < ? "
+                              "AND outcome = 'allowed' GROUP BY command ORDER BY COUNT(*) DESC",
+                              (since, until or float("inf"))))
+
+def get_command_rejections(since, until=None):
+    """
+    {outcome: count} of the in-game commands that did not run
+    (rate_limited, duplicate, unavailable, busy, failed).
+    """
+    with metrics.STORAGE_SECONDS.time(op="query"):
+        return dict(_db.query("SELECT outcome, COUNT(*) FROM command_history WHERE ts >= ? AND ts < ? "
+                              "AND outcome != 'allowed' GROUP BY outcome ORDER BY COUNT(*) DESC",
+                              (since, until or float("inf"))))
+
+def prune_history(retention_days=HISTORY_RETENTION_DAYS, now=None):
+    """
+    Deletes history older than the retention window. Returns rows removed.
+    """
+    cutoff = (now or clock.time()) - retention_days * 24 * 60 * 60
+    removed = 0
+    with metrics.STORAGE_SECONDS.time(op="prune"):
+        for table in HISTORY_TABLES:
+            removed += _db.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+    return removed
+
+def _current_season_sample():
+    season_info = get_last_season()
+    return {(season_info["season"],): 1} if season_info else {}
+
+metrics.WEATHER_PAUSED.set_callback(lambda: 1 if get_pause_state() else 0)
+metrics.CURRENT_SEASON.set_callback(_current_season_sample)
@@ -0,0 +1,48 @@
+"""
+Tests for the in-game command limiter.
+
+    python -m pytest -q
+"""
+import time
+from ratelimit import CommandLimiter, ALLOWED, DUPLICATE, RATE_LIMITED
+
+def make_limiter(**options):
+    limits = dict(user_rate=1, user_burst=2, global_rate=100, global_burst=100, dedup_seconds=10)
+    limits.update(options)
+    return CommandLimiter(**limits), time.monotonic()
+
+def test_repeats_inside_the_dedup_window_are_coalesced():
+    limiter, start = make_limiter()
+    assert limiter.check("Player1", "!setgrowth 0.5", now=start) == ALLOWED
+    # Same player and command, ignoring case and spacing
+    assert limiter.check("player1", "!SetGrowth   0.5", now=start + 9) == DUPLICATE
+    assert limiter.check("Player2", "!setgrowth 0.5", now=start + 9) == ALLOWED
+    assert limiter.check("Player1", "!setgrowth 0.5", now=start + 10) == ALLOWED
+    assert limiter.coalesced == 1
+
+def test_player_bucket_limits_distinct_commands():
+    limiter, start = make_limiter()
+    assert limiter.check("Player1", "!a", now=start) == ALLOWED
+    assert limiter.check("Player1", "!b", now=start) == ALLOWED
+    assert limiter.check("Player1", "!c", now=start) == RATE_LIMITED
+    assert limiter.check("Player1", "!c", now=start + 1) == ALLOWED
+
+def test_release_refunds_the_tokens_and_the_dedup_slot():
+    limiter, start = make_limiter(global_burst=2)
+    assert limiter.check("Player1", "!a", now=start) == ALLOWED
+    assert limiter.check("Player1", "!b", now=start) == ALLOWED
+    limiter.release("Player1", "!b")
+
+    # The retry is neither a duplicate nor over the player's or global limit
+    assert limiter.check("Player1", "!b", now=start) == ALLOWED
+    assert limiter.check("Player2", "!a", now=start) == RATE_LIMITED
+    assert limiter.released == 1
+
+def test_global_rejection_does_not_charge_the_player():
+    limiter, start = make_limiter(global_burst=1)
+    assert limiter.check("Player1", "!a", now=start) == ALLOWED
+    assert limiter.check("Player2", "!a", now=start) == RATE_LIMITED
+    assert limiter.rejected_global == 1
+    # Player2 still has a full burst once the global bucket has refilled
+    assert limiter.check("Player2", "!a", now=start + 0.01) == ALLOWED
+    assert limiter.check("Player2", "!b", now=start + 0.02) == ALLOWED
@@ -0,0 +1,83 @@
+"""
+Tests for the asyncio RCON client against FakeRconServer.
+
+    python -m pytest -q
+"""
+import asyncio
+import pytest
+from fake_rcon import FakeRconServer
+from rcon_client import AsyncRconClient, RconAuthError
+
+def run_against_server(scenario, password=None, **server_options):
+    """
+    Starts a FakeRconServer, runs `scenario(server, client)` with a client
+    logged in with `password` (the server's by default) and cleans up.
+    """
+    async def main():
+        server = await FakeRconServer(**server_options).start()
+        client = AsyncRconClient(server.host, server.port, password or server.password, timeout=2)
+        try:
+            return await scenario(server, client)
+        finally:
+            await client.close()
+            await server.stop()
+    return asyncio.run(main())
+
+def test_concurrent_commands_get_their_own_replies():
+    # Jitter makes the server answer the pipelined commands out of order
+    commands = [f"/waterquality Source{i} {i % 101}" for i in range(200)]
+
+    async def scenario(server, client):
+        replies = await asyncio.gather(*(client.command(c) for c in commands))
+        assert replies == [f"ok {c}" for c in commands]
+        assert client.connections_opened == 1
+
+    run_against_server(scenario, jitter=0.005)
+
+def test_batch_returns_replies_in_command_order():
+    commands = [f"/waterquality Source{i} {i}" for i in range(54)]
+
+    async def scenario(server, client):
+        assert await client.batch(commands) == [f"ok {c}" for c in commands]
+        assert server.commands == commands
+        assert await client.batch([]) == []
+
+    run_against_server(scenario, jitter=0.005)
+
+def test_reconnects_after_the_server_drops_the_connection():
+    async def scenario(server, client):
+        assert await client.command("/before") == "ok /before"
+        server.drop_connections()
+        await asyncio.sleep(0.05)
+        assert await client.command("/after-restart") == "ok /after-restart"
+        assert client.connections_opened == 2
+
+    run_against_server(scenario)
+
+def test_wrong_password_raises_auth_error():
+    async def scenario(server, client):
+        with pytest.raises(RconAuthError):
+            await client.command("/weather rain")
+        assert server.commands == []
+
+    run_against_server(scenario, password="wrong")
+
+def test_split_responses_are_joined():
+    commands = [f"/long{i} " for i in range(10)]
+
+    async def scenario(server, client):
+        server.respond = lambda command: command * 100
+        replies = await asyncio.gather(*(client.command(c) for c in commands))
+        assert replies == [c * 100 for c in commands]
+        assert await client.batch(commands) == [c * 100 for c in commands]
+
+    run_against_server(scenario, jitter=0.005, packet_size=64)
+
+def test_batch_reports_failures_per_command():
+    async def scenario(server, client):
+        await server.stop()
+        results = await client.batch(["/a", "/b"])
+        assert len(results) == 2
+        assert all(isinstance(result, Exception) for result in results)
+
+    run_against_server(scenario)
@@ -0,0 +1,33 @@
+"""
+Tests for the RCON dispatcher's priority classes against FakeRconServer.
+
+    python -m pytest -q
+"""
+import asyncio
+from fake_rcon import FakeRconServer
+from rcon import RconServer, BULK, INTERACTIVE
+
+def test_interactive_command_cuts_ahead_of_a_bulk_batch():
+    commands = [f"/waterquality Source{i} {i % 101}" for i in range(400)]
+
+    async def main():
+        fake = await FakeRconServer(latency=0.01).start()
+        server = RconServer("test", fake.host, fake.port, fake.password)
+        try:
+            bulk = asyncio.create_task(server.batch(commands, priority=BULK))
+            # Let the batch fill the bulk queue and occupy every worker
+            while not server.dispatcher.completed[BULK]:
+                await asyncio.sleep(0.005)
+
+            assert await server.command("/teleport player1 spawn", priority=INTERACTIVE) == \
+                "ok /teleport player1 spawn"
+            assert not bulk.done()
+            assert server.dispatcher.stats()[BULK]["depth"] > 0
+
+            assert await bulk == [f"ok {c}" for c in commands]
+            assert server.dispatcher.completed[INTERACTIVE] == 1
+        finally:
+            await server.close()
+            await fake.stop()
+
+    asyncio.run(main())
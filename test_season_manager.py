@@ -0,0 +1,35 @@
+"""
+Tests for the season arithmetic.
+
+    python -m pytest -q
+"""
+import datetime
+from season_manager import season_at, anchor_for, SEASONS, SEASON_LENGTH_DAYS
+
+ANCHOR = datetime.datetime(2026, 3, 1)
+LENGTH = datetime.timedelta(days=SEASON_LENGTH_DAYS)
+
+def test_seasons_change_exactly_at_the_boundaries():
+    assert season_at(ANCHOR, ANCHOR) == ("The Blooming", ANCHOR, ANCHOR + LENGTH)
+
+    just_before = ANCHOR + LENGTH - datetime.timedelta(microseconds=1)
+    assert season_at(just_before, ANCHOR)[0] == "The Blooming"
+    assert season_at(ANCHOR + LENGTH, ANCHOR) == ("The Drought", ANCHOR + LENGTH, ANCHOR + 2 * LENGTH)
+
+    for i, season in enumerate(SEASONS):
+        assert season_at(ANCHOR + i * LENGTH + datetime.timedelta(hours=1), ANCHOR)[0] == season
+
+def test_rotation_wraps_and_works_before_the_anchor():
+    cycle = len(SEASONS) * LENGTH
+    assert season_at(ANCHOR + cycle, ANCHOR) == ("The Blooming", ANCHOR + cycle, ANCHOR + cycle + LENGTH)
+    # Years of downtime are still one lookup
+    assert season_at(ANCHOR + 100 * cycle + LENGTH, ANCHOR)[0] == "The Drought"
+    assert season_at(ANCHOR - datetime.timedelta(seconds=1), ANCHOR) == ("The Freeze", ANCHOR - LENGTH, ANCHOR)
+
+def test_manual_reset_starts_the_season_now_and_continues_the_rotation():
+    now = datetime.datetime(2026, 3, 10, 12, 30)
+    anchor = anchor_for("The Brightening", now)
+
+    assert season_at(now, anchor) == ("The Brightening", now, now + LENGTH)
+    assert season_at(now + LENGTH, anchor) == ("The Freeze", now + LENGTH, now + 2 * LENGTH)
+    assert season_at(now + 2 * LENGTH, anchor)[0] == "The Blooming"
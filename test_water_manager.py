@@ -0,0 +1,67 @@
+"""
+Tests for the water transition ramp.
+
+    python -m pytest -q
+"""
+import asyncio
+import datetime
+import pytest
+import water_manager
+from water_manager import WaterManager, ramp_values, ramp_schedule
+
+def test_ramp_schedule_interleaves_sources_at_an_even_pace():
+    ramps = {
+        "Long": (0, ramp_values(0, 100, min_change=20)),
+        "Short": (40, ramp_values(40, 100, min_change=20)),
+        "New": (None, ramp_values(None, 100, min_change=20)),
+    }
+    assert ramps["Long"][1] == [20, 40, 60, 80, 100]
+    assert ramps["Short"][1] == [60, 80, 100]
+
+    schedule = ramp_schedule(ramps)
+    assert schedule[0] == ("New", 1)
+    assert schedule[-2:] == [("Long", 5), ("Short", 3)]
+    for source, (_, values) in ramps.items():
+        assert [taken for s, taken in schedule if s == source] == list(range(1, len(values) + 1))
+
+@pytest.fixture
+def sent(monkeypatch):
+    """
+    Stands in for the game server: every /waterquality succeeds and the
+    batches sent are collected.
+    """
+    batches = []
+
+    async def send_rcon_batch(commands, priority, server):
+        batches.append(commands)
+        return [f"ok {command}" for command in commands]
+
+    async def log_to_discord(bot, message):
+        pass
+
+    monkeypatch.setattr(water_manager, "send_rcon_batch", send_rcon_batch)
+    monkeypatch.setattr(water_manager, "rcon_available", lambda server_id: True)
+    monkeypatch.setattr(water_manager, "record_water", lambda *args: None)
+    monkeypatch.setattr(water_manager, "log_to_discord", log_to_discord)
+    return batches
+
+@pytest.mark.parametrize("tick_phase", [0.0, 0.3, 0.99])
+def test_ramp_finishes_inside_the_window(sent, tick_phase):
+    manager = WaterManager()
+    applied = manager.desired_quality("The Drought")
+    desired = manager.desired_quality("The Brightening")
+    started = datetime.datetime(2026, 3, 15)
+    transition = manager.plan_transition(applied, desired, "The Brightening", started)
+    state = {"applied": dict(applied), "transition": transition}
+
+    # The scheduler's ticks don't line up with the ramp's start
+    step = datetime.timedelta(seconds=manager.transition_step)
+    now = started + tick_phase * step
+    while "transition" in state:
+        assert now - started <= manager.transition_window
+        asyncio.run(manager._transition_step("main", state, now))
+        now += step
+
+    assert state["applied"] == desired
+    assert sum(len(batch) for batch in sent) == transition["commands"]
+    assert max(len(batch) for batch in sent) <= transition["budget"]
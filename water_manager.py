@@ -1,12 +1,54 @@
 import asyncio
 import datetime
-from storage import get_last_season
+import math
+import clock
+from storage import get_water_state, set_water_state, record_water
+from season_manager import current_season
 from logger import log_to_discord
-from rcon import send_rcon_command  # uses your rcon.py
+from rcon import send_rcon_batch, rcon_available, servers, DEFAULT_SERVER, BULK  # uses your rcon.py
+from events import bus, SeasonChanged
+from config import (
+    WATER_TRANSITION_MINUTES, WATER_TRANSITION_STEP,
+    WATER_TRANSITION_BUDGET, WATER_TRANSITION_MIN_CHANGE
+)
+
+# Even in steady state, re-send every source this often in case the
+# server lost its settings (restart, admin edit) without us noticing
+FULL_RESYNC_INTERVAL = datetime.timedelta(hours=24)
+
+def ramp_values(start, end, min_change=WATER_TRANSITION_MIN_CHANGE):
+    """
+    The qualities a source steps through on its way from `start` to
+    `end`, `end` included. A source whose start is unknown goes straight
+    to `end`.
+    """
+    if start is None:
+        return [end]
+    step = min_change if end > start else -min_change
+    return list(range(start + step, end, step)) + [end]
+
+def ramp_schedule(ramps):
+    """
+    [(source, steps taken)] for every update of every ramp, in the order
+    they fall due. Each source moves at its own even pace and the sources
+    are interleaved, so sending the first ceil(n * progress) entries keeps
+    the command rate flat. Sources with an unknown start come first.
+    """
+    entries = sorted(
+        (0.0 if len(values) == 1 and start is None else (k + 1) / len(values), source, k + 1)
+        for source, (start, values) in ramps.items()
+        for k in range(len(values))
+    )
+    return [(source, taken) for _, source, taken in entries]
 
 class WaterManager:
     def __init__(self):
-        self.interval = 3 * 60 * 60  # 3 hours in seconds
+        self.interval = 30 * 60  # 30 minutes in seconds; a no-op run sends nothing
+        # Scheduled runs and season-change runs share the applied map
+        self._lock = asyncio.Lock()
+        bus.subscribe(SeasonChanged, self.on_season_changed)
+        self.transition_window = datetime.timedelta(minutes=WATER_TRANSITION_MINUTES)
+        self.transition_step = WATER_TRANSITION_STEP
 
         # All known water sources
         self.all_sources = [
@@ -31,52 +73,265 @@ class WaterManager:
         # Hotsprings
         self.hotsprings = [f"Hotspring{i}" for i in range(1, 25)]
 
-    async def start_water_loop(self):
+    def desired_quality(self, season):
+        """
+        Returns {source: quality} for the given season.
+        An empty dict means the season leaves water untouched.
+        """
+        if season == "The Drought":
+            # All water 0, but major sources 40
+            return {
+                source: 40 if source in self.major_sources else 0
+                for source in self.all_sources
+            }
+
+        if season == "The Brightening":
+            # All water sources 100
+            return {source: 100 for source in self.all_sources}
+
+        if season == "The Freeze":
+            # Major + hotsprings => 50; others => 0
+            return {
+                source: 50 if source in self.major_sources or source in self.hotsprings else 0
+                for source in self.all_sources
+            }
+
+        # The Blooming: no changes
+        return {}
+
+    async def on_season_changed(self, event):
         """
-        Main loop that waits 3 hours, 
-        then applies water logic based on the current season.
+        Applies the new season's water levels straight away instead of at
+        the next scheduled run.
         """
-        while True:
-            await self.apply_water_logic()
-            await asyncio.sleep(self.interval)
+        await self.apply_water_logic(season=event.season)
 
-    async def apply_water_logic(self):
+    async def apply_water_logic(self, force_full=False, season=None):
         """
-        Reads the current season, then issues water quality commands via RCON.
+        Reads the current season (unless given) and sends /waterquality
+        only for sources whose last applied value differs from what the
+        season wants, on every game server at once.
+        Every FULL_RESYNC_INTERVAL (or with force_full) all sources are sent.
+        When the season changed, a transition is started instead and
+        run_transition_tick ramps the sources; force_full skips the ramp.
         """
-        season_info = get_last_season()
-        if not season_info:
+        async with self._lock:
+            await self._apply(force_full, season or current_season()["season"])
+
+    async def _apply(self, force_full, season):
+        desired = self.desired_quality(season)
+        if not desired:
+            await log_to_discord(None, f"[Water Manager] {season} - no water quality changes.")
             return
 
-        season = season_info["season"]
-        commands = []
+        now = clock.utcnow()
+        state = get_water_state()
+        server_states = state.get("servers")
+        if server_states is None:
+            # Single-server state from before RCON_SERVERS: it belongs to the default server
+            server_states = {DEFAULT_SERVER: state} if state else {}
+
+        await asyncio.gather(*(
+            self._apply_server(server_id, server_states.setdefault(server_id, {}), desired, force_full, season, now)
+            for server_id in servers
+        ))
+        set_water_state({"servers": server_states})
 
-        if season == "The Blooming":
-            # No changes
-            await log_to_discord(None, "[Water Manager] Blooming - no water quality changes.")
+    async def _apply_server(self, server_id, state, desired, force_full, season, now):
+        """
+        Brings one server's water in line with `desired`, updating its
+        entry in the water state ({"applied", "last_full_sync", "season",
+        "transition"}) in place.
+        """
+        if not rcon_available(server_id):
+            # Nothing is marked applied, so the next run sends everything due
+            print(f"[Water Manager] {server_id} unreachable, skipping this run.")
             return
 
-        elif season == "The Drought":
-            # All water 0, but major sources 40
-            for source in self.all_sources:
-                quality = 40 if source in self.major_sources else 0
-                commands.append(f"/waterquality {source} {quality}")
+        applied = state.get("applied", {})
+        transition = state.get("transition")
+        if force_full or (transition is not None and transition["season"] != season):
+            # Jump straight to the levels wanted now; a newer season that
+            # arrives mid-ramp starts its own ramp from where the sources are
+            state.pop("transition", None)
+            transition = None
+        if transition is None and self.transition_window and not force_full \
+                and state.get("season") not in (None, season):
+            transition = self.plan_transition(applied, desired, season, now)
+            if transition is not None:
+                state["transition"] = transition
+                minutes = self.transition_window.total_seconds() / 60
+                await log_to_discord(None, f"[Water Manager] {server_id}: ramping {len(transition['sources'])} water sources to {season} levels over {minutes:.0f} minutes ({transition['commands']} updates, {transition['budget']} per step)")
+                if transition["budget"] * self.ramp_steps() < transition["commands"]:
+                    needed = math.ceil(transition["commands"] / transition["budget"]) * self.transition_step / 60
+                    await log_to_discord(None, f"[Water Manager] WARNING {server_id}: WATER_TRANSITION_BUDGET={WATER_TRANSITION_BUDGET} is too low to finish the ramp in {minutes:.0f} minutes; it will take about {needed:.0f}")
+        state["season"] = season
+        if transition is not None:
+            # run_transition_tick owns the sources until the ramp is done
+            return
 
-        elif season == "The Brightening":
-            # All water sources 100
-            for source in self.all_sources:
-                commands.append(f"/waterquality {source} 100")
+        last_full_sync = state.get("last_full_sync")
 
-        elif season == "The Freeze":
-            # Major + hotsprings => 50; others => 0
-            for source in self.all_sources:
-                if source in self.major_sources or source in self.hotsprings:
-                    commands.append(f"/waterquality {source} 50")
-                else:
-                    commands.append(f"/waterquality {source} 0")
+        full = (
+            force_full
+            or last_full_sync is None
+            or now - datetime.datetime.fromisoformat(last_full_sync) >= FULL_RESYNC_INTERVAL
+        )
+        if full:
+            changes = desired
+        else:
+            changes = {
+                source: quality for source, quality in desired.items()
+                if applied.get(source) != quality
+            }
+        if not changes:
+            return
+
+        commands = [f"/waterquality {source} {quality}" for source, quality in changes.items()]
+        results = await send_rcon_batch(commands, priority=BULK, server=server_id)
 
-        for cmd in commands:
-            await send_rcon_command(cmd)
+        failed = 0
+        for (source, quality), result in zip(changes.items(), results):
+            if result is None:
+                failed += 1
+                # Unknown outcome: forget it so the next run sends it again
+                applied.pop(source, None)
+            else:
+                applied[source] = quality
 
-        await log_to_discord(None, f"[Water Manager] Applied {len(commands)} water quality updates for {season}")
+        state["applied"] = applied
+        if full and not failed:
+            state["last_full_sync"] = now.isoformat()
+
+        record_water(server_id, season, "full" if full else "diff", len(commands), failed)
+
+        kind = "full resync" if full else "changed"
+        if failed:
+            await log_to_discord(None, f"[Water Manager] {server_id}: applied {len(commands) - failed}/{len(commands)} {kind} water quality updates for {season} ({failed} failed)")
+        else:
+            await log_to_discord(None, f"[Water Manager] {server_id}: applied {len(commands)} {kind} water quality updates for {season}")
+
+    def ramp_steps(self):
+        """
+        Transition ticks the ramp is spread over. The last one is kept
+        free so tick alignment can't push the end past the window.
+        """
+        return max(1, int(self.transition_window.total_seconds() // self.transition_step) - 1)
+
+    def ramps(self, transition, desired):
+        """
+        {source: (start, ramp_values)} for the sources a transition moves.
+        """
+        return {
+            source: (transition["from"].get(source), ramp_values(transition["from"].get(source), final))
+            for source, final in desired.items() if source in transition.get("sources", transition["from"])
+        }
+
+    def plan_transition(self, applied, desired, season, now):
+        """
+        Returns the transition record for ramping to `desired`, or None if
+        nothing needs to change. "from" holds the quality each changing
+        source had when the ramp began; sources never applied are left out
+        and go straight to their new value. "budget" is the commands per
+        tick that finish the ramp inside the window, capped at
+        WATER_TRANSITION_BUDGET.
+        """
+        changing = {
+            source: applied.get(source) for source, quality in desired.items()
+            if applied.get(source) != quality
+        }
+        if not changing:
+            return None
+        transition = {
+            "season": season,
+            "started": now.isoformat(),
+            "sources": sorted(changing),
+            "from": {source: quality for source, quality in changing.items() if quality is not None},
+        }
+        total = sum(len(values) for _, values in self.ramps(transition, desired).values())
+        transition["commands"] = total
+        transition["budget"] = min(WATER_TRANSITION_BUDGET, math.ceil(total / self.ramp_steps()))
+        return transition
+
+    async def run_transition_tick(self):
+        """
+        Scheduled every WATER_TRANSITION_STEP seconds. Moves every server
+        with a transition in progress one step along its ramp; a no-op
+        when none is. Progress lives in the water state, so after a
+        restart the ramp picks up where the applied map left off.
+        """
+        async with self._lock:
+            state = get_water_state()
+            server_states = state.get("servers", {})
+            active = [
+                server_id for server_id, server_state in server_states.items()
+                if server_state.get("transition") and server_id in servers
+            ]
+            if not active:
+                return
+            now = clock.utcnow()
+            await asyncio.gather(*(
+                self._transition_step(server_id, server_states[server_id], now)
+                for server_id in active
+            ))
+            set_water_state({"servers": server_states})
+
+    async def _transition_step(self, server_id, state, now):
+        """
+        Sends at most the transition's budget of commands to one server.
+        The schedule says how many steps each source should have taken by
+        now; the applied map says how many it has. Sources that are behind
+        are moved to where they should be, furthest behind first.
+        """
+        if not rcon_available(server_id):
+            return
+
+        transition = state["transition"]
+        season = transition["season"]
+        desired = self.desired_quality(season)
+        applied = state.setdefault("applied", {})
+        started = datetime.datetime.fromisoformat(transition["started"])
+        elapsed_steps = (now - started).total_seconds() / self.transition_step
+        progress = min(1.0, elapsed_steps / self.ramp_steps())
+
+        ramps = self.ramps(transition, desired)
+        schedule = ramp_schedule(ramps)
+        should_take = {}
+        for source, taken in schedule[:math.ceil(len(schedule) * progress)]:
+            should_take[source] = taken
+
+        due = []
+        for source, taken in should_take.items():
+            start, values = ramps[source]
+            current = applied.get(source)
+            if current == start:
+                done = 0
+            elif current in values:
+                done = values.index(current) + 1
+            else:
+                done = None  # unknown, e.g. a failed send: resend where it should be
+            if done is None or done < taken:
+                due.append((taken - (done or 0), source, values[taken - 1]))
+
+        due.sort(key=lambda item: (-item[0], item[1]))
+        changes = {source: quality for _, source, quality in due[:transition.get("budget", WATER_TRANSITION_BUDGET)]}
+        if changes:
+            commands = [f"/waterquality {source} {quality}" for source, quality in changes.items()]
+            results = await send_rcon_batch(commands, priority=BULK, server=server_id)
+            failed = 0
+            for (source, quality), result in zip(changes.items(), results):
+                if result is None:
+                    failed += 1
+                    applied.pop(source, None)
+                else:
+                    applied[source] = quality
+            record_water(server_id, season, "ramp", len(commands), failed)
+            if failed:
+                await log_to_discord(None, f"[Water Manager] {server_id}: {failed}/{len(commands)} water ramp updates for {season} failed")
 
+        if all(applied.get(source) == quality for source, quality in desired.items()):
+            del state["transition"]
+            minutes = (now - started).total_seconds() / 60
+            await log_to_discord(None, f"[Water Manager] {server_id}: water reached {season} levels after {minutes:.0f} minutes")
+            if now - started > self.transition_window:
+                await log_to_discord(None, f"[Water Manager] WARNING {server_id}: the ramp to {season} overran its {self.transition_window.total_seconds() / 60:.0f} minute window")
@@ -0,0 +1,185 @@
+"""
+Monte Carlo analysis of the weather rules.
+
+Simulates many independent seasons of weather ticks at once with NumPy,
+following the same rules as weather_manager.pick_planned_weather: the
+options in SEASON_WEATHER_RULES, no more than BLOOMING_MAX_WET_STREAK
+rain/storm ticks in a row in The Blooming, and in The Brightening a
+BRIGHTENING_RAIN_CHANCE of rain once BRIGHTENING_RAIN_SPACING has passed
+since the last one. Every chain advances in the same vectorized step, so
+a few million ticks take seconds.
+
+For each season it reports the weather distribution, how long each
+weather and each rain/storm streak lasts, the spacing between
+Brightening rains, and the RCON and Discord traffic a season generates.
+The interval and the constraints can be overridden to see the effect of
+a change before making it.
+
+NumPy is only needed for this tool, not by the bot:
+
+    pip install numpy
+    python weather_analyzer.py --chains 2000 --servers 2 --interval 20
+"""
+import argparse
+import datetime
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise SystemExit("weather_analyzer.py needs NumPy, which the bot itself does not install: pip install numpy")
+
+from season_manager import SEASONS, SEASON_LENGTH_DAYS
+from weather_manager import (
+    SEASON_WEATHER_RULES, WEATHER_INTERVAL, WET_WEATHER,
+    BLOOMING_MAX_WET_STREAK, BRIGHTENING_RAIN_SPACING, BRIGHTENING_RAIN_CHANCE
+)
+
+def simulate_season(season, chains, ticks, rng, max_wet_streak, rain_chance, rain_spacing_ticks):
+    """
+    Returns a (chains, ticks) int8 array of indexes into the season's
+    options, one row per independently simulated season.
+    """
+    options = SEASON_WEATHER_RULES[season]
+    wet = np.array([weather in WET_WEATHER for weather in options])
+    dry = np.flatnonzero(~wet)
+    rain = options.index("rain") if "rain" in options else None
+    not_rain = np.array([i for i in range(len(options)) if i != rain])
+
+    picks = np.empty((chains, ticks), dtype=np.int8)
+    streak = np.zeros(chains, dtype=np.int32)
+    last_rain = np.full(chains, -rain_spacing_ticks, dtype=np.int64)
+
+    for tick in range(ticks):
+        if season == "The Blooming":
+            pick = rng.integers(len(options), size=chains)
+            capped = np.flatnonzero(streak >= max_wet_streak)
+            if len(dry) and len(capped):
+                pick[capped] = dry[rng.integers(len(dry), size=len(capped))]
+
+        elif season == "The Brightening":
+            pick = not_rain[rng.integers(len(not_rain), size=chains)]
+            if rain is not None:
+                rains = (tick - last_rain >= rain_spacing_ticks) & (rng.random(chains) < rain_chance)
+                pick[rains] = rain
+
+        else:
+            pick = rng.integers(len(options), size=chains)
+
+        streak = np.where(wet[pick], streak + 1, 0)
+        if rain is not None:
+            last_rain = np.where(pick == rain, tick, last_rain)
+        picks[:, tick] = pick
+    return picks
+
+def run_lengths(mask):
+    """
+    Lengths of every run of True along the rows of a 2-D boolean array.
+    Runs never continue from one row (season) into the next.
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+def gaps_between(mask):
+    """
+    Ticks between consecutive True entries within each row.
+    """
+    positions = np.flatnonzero(mask)
+    rows = positions // mask.shape[1]
+    return np.diff(positions)[rows[1:] == rows[:-1]]
+
+def describe(values, scale):
+    """
+    "mean / p50 / p99 / max" of `values` multiplied by `scale`.
+    """
+    if not len(values):
+        return "-"
+    scaled = values * scale
+    return " / ".join(f"{v:.1f}" for v in (
+        scaled.mean(), np.percentile(scaled, 50), np.percentile(scaled, 99), scaled.max()))
+
+def analyze_season(season, picks, args, hours_per_tick, rain_spacing_ticks):
+    options = SEASON_WEATHER_RULES[season]
+    chains, ticks = picks.shape
+    lines = [f"{season}: {chains} seasons x {ticks} ticks = {chains * ticks:,} ticks"]
+    violations = []
+
+    counts = np.bincount(picks.ravel(), minlength=len(options))
+    lines.append(f"  {'weather':<10} {'share':>7} {'hours/season':>13}   run length h (mean / p50 / p99 / max)")
+    for i, weather in enumerate(options):
+        share = counts[i] / picks.size
+        lines.append(f"  {weather:<10} {share:>7.1%} {share * ticks * hours_per_tick:>13.1f}   "
+                     f"{describe(run_lengths(picks == i), hours_per_tick)}")
+
+    wet = np.isin(picks, [i for i, weather in enumerate(options) if weather in WET_WEATHER])
+    if wet.any():
+        streaks = run_lengths(wet)
+        lines.append(f"  rain/storm streaks: {len(streaks) / chains:.1f} per season, "
+                     f"length in ticks {describe(streaks, 1)}")
+        if season == "The Blooming" and streaks.max() > args.max_wet_streak:
+            violations.append(f"{season}: {streaks.max()} rain/storm ticks in a row")
+
+    if "rain" in options:
+        rain = picks == options.index("rain")
+        gaps = gaps_between(rain)
+        lines.append(f"  rain: {rain.sum() / chains:.1f} ticks per season, "
+                     f"{rain.sum() / chains / SEASON_LENGTH_DAYS:.2f} per day, "
+                     f"hours between rains {describe(gaps, hours_per_tick)}")
+        if season == "The Brightening" and len(gaps) and gaps.min() < rain_spacing_ticks:
+            violations.append(f"{season}: rains {gaps.min() * hours_per_tick:.1f}h apart")
+
+    # The bot sends every tick whether or not the weather changed
+    changes = (picks[:, 1:] != picks[:, :-1]).sum(axis=1).mean() + 1
+    lines.append(f"  traffic per season: {ticks * args.servers:,} RCON /weather commands "
+                 f"({args.servers / hours_per_tick:.1f}/h), {ticks:,} #weather_updates posts, "
+                 f"{ticks:,} log lines; {changes:.0f} ticks actually change the weather "
+                 f"({changes / ticks:.0%})")
+    return lines, violations
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo analysis of the weather rules (needs NumPy)")
+    parser.add_argument("--chains", type=int, default=2000, help="seasons simulated in parallel, per season")
+    parser.add_argument("--season", choices=SEASONS, action="append",
+                        help="season to analyze (repeatable; default all)")
+    parser.add_argument("--interval", type=float, default=WEATHER_INTERVAL / 60, help="minutes per weather tick")
+    parser.add_argument("--servers", type=int, default=1, help="game servers each tick is broadcast to")
+    parser.add_argument("--max-wet-streak", type=int, default=BLOOMING_MAX_WET_STREAK,
+                        help="most rain/storm ticks in a row in The Blooming")
+    parser.add_argument("--rain-chance", type=float, default=BRIGHTENING_RAIN_CHANCE,
+                        help="chance of rain per allowed tick in The Brightening")
+    parser.add_argument("--rain-spacing", type=float, default=BRIGHTENING_RAIN_SPACING / datetime.timedelta(hours=1),
+                        help="minimum hours between rains in The Brightening")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    interval = args.interval * 60
+    ticks = int(SEASON_LENGTH_DAYS * 24 * 60 * 60 // interval)
+    hours_per_tick = interval / 3600
+    rain_spacing_ticks = math.ceil(args.rain_spacing * 3600 / interval)
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{ticks} ticks of {args.interval:g} min per {SEASON_LENGTH_DAYS}-day season; "
+          f"Blooming wet streak <= {args.max_wet_streak}, Brightening rain {args.rain_chance:.0%} "
+          f"at least {args.rain_spacing:g}h apart")
+    violations = []
+    for season in args.season or SEASONS:
+        started = time.perf_counter()
+        picks = simulate_season(season, args.chains, ticks, rng,
+                                args.max_wet_streak, args.rain_chance, rain_spacing_ticks)
+        lines, found = analyze_season(season, picks, args, hours_per_tick, rain_spacing_ticks)
+        violations += found
+        print()
+        print("\n".join(lines))
+        print(f"  ({time.perf_counter() - started:.2f} s)")
+
+    print()
+    print(f"Rule violations: {len(violations)}")
+    for violation in violations:
+        print(f"  - {violation}")
+    raise SystemExit(1 if violations else 0)
+
+if __name__ == "__main__":
+    main()
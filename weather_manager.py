@@ -1,13 +1,17 @@
 import random
 import datetime
-import asyncio
+import hashlib
+import clock
+import metrics
 from config import CHANNEL_IDS
 from storage import (
-    get_last_season, get_last_weather, set_last_weather,
-    get_pause_state
+    get_last_weather, set_last_weather, get_pause_state, record_weather,
+    get_weather_plan, set_weather_plan
 )
+from season_manager import SEASON_LENGTH_DAYS, current_season
 from logger import log_to_discord
-from rcon import send_rcon_command
+from rcon import broadcast_rcon_command, WEATHER as RCON_WEATHER
+from events import bus, SeasonChanged, WeatherChanged, PauseToggled
 
 # A dictionary mapping each season to possible weather types
 SEASON_WEATHER_RULES = {
@@ -55,43 +59,205 @@ WEATHER_FLAVOR = {
     ]
 }
 
+# Constraints enforced when planning a season's weather
+WEATHER_INTERVAL = 20 * 60                       # seconds per weather tick
+WET_WEATHER = ("rain", "storm")
+BLOOMING_MAX_WET_STREAK = 2                      # never 3 rain/storm ticks in a row
+BRIGHTENING_RAIN_SPACING = datetime.timedelta(hours=6)
+BRIGHTENING_RAIN_CHANCE = 0.25
+
+# One character per tick keeps a whole season's plan to ~1000 bytes
+WEATHER_CODES = {
+    "rain": "r", "storm": "s", "overcast": "o", "cloudy": "c",
+    "fog": "f", "snow": "n", "clearsky": "k",
+}
+WEATHER_FROM_CODE = {code: weather for weather, code in WEATHER_CODES.items()}
+
+WEATHER_EMOJI = {
+    "rain": "🌧️", "storm": "⛈️", "overcast": "☁️", "cloudy": "🌤️",
+    "snow": "❄️", "clearsky": "☀️", "fog": "🌫️",
+}
+
+def plan_seed(season, start):
+    """
+    Stable seed for a season's plan, so the same season start always
+    produces the same weather even if the stored plan is lost.
+    """
+    digest = hashlib.sha256(f"{season}|{start}".encode("utf8")).hexdigest()
+    return int(digest[:16], 16)
+
+def pick_planned_weather(rng, season, options, state, tick_time):
+    """
+    Chooses one tick's weather based on:
+      - Blooming: avoid 3 consecutive rain/storm
+      - Brightening: only 1 rain every 6 hours with a 25% chance
+      - Otherwise, random from the valid options
+    `state` carries the streak and last rain time between ticks and is
+    updated in place.
+    """
+    if season == "The Blooming" and state["wet_streak"] >= BLOOMING_MAX_WET_STREAK:
+        safe = [w for w in options if w not in WET_WEATHER]
+        choice = rng.choice(safe or options)
+
+    elif season == "The Brightening":
+        last_rain = state["last_rain_time"]
+        rain_allowed = last_rain is None or tick_time - last_rain >= BRIGHTENING_RAIN_SPACING
+        safe = [w for w in options if w != "rain"]
+        if "rain" in options and rain_allowed and rng.random() < BRIGHTENING_RAIN_CHANCE:
+            choice = "rain"
+        else:
+            choice = rng.choice(safe)
+
+    else:
+        choice = rng.choice(options)
+
+    state["wet_streak"] = state["wet_streak"] + 1 if choice in WET_WEATHER else 0
+    if choice == "rain":
+        state["last_rain_time"] = tick_time
+    return choice
+
+def plan_season_weather(season, start, seed=None):
+    """
+    Generates the whole season's weather up front: one entry per
+    WEATHER_INTERVAL from `start` until the season ends.
+    Returns the persisted plan dict.
+    """
+    options = SEASON_WEATHER_RULES.get(season, [])
+    start_iso = start.isoformat() if isinstance(start, datetime.datetime) else start
+    start_dt = datetime.datetime.fromisoformat(start_iso)
+    seed = plan_seed(season, start_iso) if seed is None else seed
+    rng = random.Random(seed)
+
+    ticks = SEASON_LENGTH_DAYS * 24 * 60 * 60 // WEATHER_INTERVAL
+    interval = datetime.timedelta(seconds=WEATHER_INTERVAL)
+    state = {"wet_streak": 0, "last_rain_time": None}
+    sequence = []
+    if options:
+        for i in range(ticks):
+            weather = pick_planned_weather(rng, season, options, state, start_dt + i * interval)
+            sequence.append(WEATHER_CODES[weather])
+
+    return {
+        "season": season,
+        "start": start_iso,
+        "interval": WEATHER_INTERVAL,
+        "seed": seed,
+        "sequence": "".join(sequence),
+    }
+
+_plan_cache = None
+
+def current_weather_plan(season_info=None):
+    """
+    Returns the plan for the current season, generating and persisting it
+    the first time it is needed. Later calls are served from memory.
+    """
+    global _plan_cache
+    season_info = season_info or current_season()
+
+    key = (season_info["season"], season_info["start"])
+    if _plan_cache is not None and (_plan_cache["season"], _plan_cache["start"]) == key:
+        return _plan_cache
+
+    plan = get_weather_plan()
+    if not plan or (plan.get("season"), plan.get("start")) != key:
+        plan = plan_season_weather(*key)
+        set_weather_plan(plan)
+    _plan_cache = plan
+    return plan
+
+def planned_weather_at(plan, when):
+    """
+    O(1) lookup of the planned weather for the tick containing `when`.
+    Returns None outside the plan.
+    """
+    if not plan or not plan["sequence"]:
+        return None
+    elapsed = (when - datetime.datetime.fromisoformat(plan["start"])).total_seconds()
+    index = int(elapsed // plan["interval"])
+    if not 0 <= index < len(plan["sequence"]):
+        return None
+    return WEATHER_FROM_CODE[plan["sequence"][index]]
+
+def get_forecast(now, count):
+    """
+    Returns [(tick_start, weather), ...] for the current tick and the
+    `count - 1` after it, stopping at the end of the season.
+    """
+    plan = current_weather_plan()
+    if not plan or not plan["sequence"]:
+        return []
+    start = datetime.datetime.fromisoformat(plan["start"])
+    interval = datetime.timedelta(seconds=plan["interval"])
+    first = max(0, int((now - start).total_seconds() // plan["interval"]))
+    last = min(len(plan["sequence"]), first + count)
+    return [
+        (start + i * interval, WEATHER_FROM_CODE[plan["sequence"][i]])
+        for i in range(first, last)
+    ]
+
 class WeatherManager:
     def __init__(self, bot):
         self.bot = bot
-        self.weather_interval = 20 * 60  # 20 minutes in seconds
-        self.blooming_streak = 0
-        self.last_rain_time = None
+        self.weather_interval = WEATHER_INTERVAL
+        # Kept current by PauseToggled events; storage is only read once
+        self.paused = get_pause_state()
+        bus.subscribe(PauseToggled, self.on_pause_toggled)
+        bus.subscribe(SeasonChanged, self.on_season_changed)
+        # (season, season start, tick index) of the last weather applied
+        self.applied_tick = None
+
+    def on_pause_toggled(self, event):
+        self.paused = event.paused
 
-    async def start_weather_loop(self):
+    async def on_season_changed(self, event):
         """
-        Repeats every 20 minutes. Checks pause state, picks new weather if unpaused.
+        Switches to the new season's weather right away instead of at the
+        next 20-minute tick.
         """
-        while True:
-            if not get_pause_state():
-                await self.update_weather()
-            await asyncio.sleep(self.weather_interval)
+        if not self.paused:
+            await self.update_weather({"season": event.season, "start": event.start})
 
-    async def update_weather(self):
+    def tick_key(self, season_info, now):
+        start = datetime.datetime.fromisoformat(season_info["start"])
+        return season_info["season"], season_info["start"], int((now - start).total_seconds() // WEATHER_INTERVAL)
+
+    async def run_tick(self):
         """
-        Reads the current season, picks a random weather type (with constraints),
-        sends an RCON command, and posts a flavor text message to #weather_updates.
+        Scheduled every 20 minutes. Checks pause state, applies the planned weather if unpaused.
         """
-        season_info = get_last_season()
-        if not season_info:
-            # No season is set yet
-            return
+        if not self.paused:
+            await self.update_weather()
 
-        season = season_info["season"]
-        now = datetime.datetime.utcnow()
-        possible_weathers = SEASON_WEATHER_RULES.get(season, [])
-        if not possible_weathers:
+    async def update_weather(self, season_info=None):
+        """
+        Reads the current season (unless given), looks up this tick's
+        weather in the season's plan, sends the RCON command to every game
+        server at once, and posts a flavor text message to #weather_updates.
+        A tick that was already applied (the season change and the regular
+        tick can land on the same one) is not sent or announced twice.
+        """
+        now = clock.utcnow()
+        season_info = season_info or current_season(now)
+        if self.applied_tick == self.tick_key(season_info, now):
             return
-
-        chosen_weather = await self.pick_weather(season, possible_weathers, now)
+        chosen_weather = self.pick_weather(season_info, now)
         if chosen_weather:
-            # Send RCON command to the server
-            await send_rcon_command(f"/weather {chosen_weather}")
+            # Servers that are down fail fast; only announce what was applied
+            results = await broadcast_rcon_command(f"/weather {chosen_weather}", priority=RCON_WEATHER)
+            failed = [server_id for server_id, result in results.items() if result is None]
+            if len(failed) == len(results):
+                print(f"[WeatherManager] No game server reachable, skipping '{chosen_weather}'.")
+                return
+            if failed:
+                await log_to_discord(self.bot, f"[WeatherManager] '{chosen_weather}' not applied on: {', '.join(failed)}")
+            self.applied_tick = self.tick_key(season_info, now)
+            previous_weather = get_last_weather()
             set_last_weather(chosen_weather)
+            record_weather(chosen_weather, season_info["season"])
+            # Most ticks repeat the previous weather; only a change is news
+            if chosen_weather != previous_weather:
+                bus.publish(WeatherChanged(weather=chosen_weather, season=season_info["season"]))
 
             # Select flavor text if available
             flavor_lines = WEATHER_FLAVOR.get(chosen_weather, [])
@@ -103,49 +269,15 @@ class WeatherManager:
             # Post flavor text to weather_updates channel
             weather_channel = self.bot.get_channel(CHANNEL_IDS["weather_updates"])
             if weather_channel:
-                await weather_channel.send(flavor_text)
+                with metrics.DISCORD_SEND_SECONDS.time(kind="weather"):
+                    await weather_channel.send(flavor_text)
 
             await log_to_discord(self.bot, f"[WeatherManager] Changed to '{chosen_weather}' - {flavor_text}")
 
-    async def pick_weather(self, season, options, now):
+    def pick_weather(self, season_info, now):
         """
-        Chooses weather based on:
-          - Blooming: avoid 3 consecutive rain/storm
-          - Brightening: only 1 rain every 6 hours with a 25% chance
-          - Otherwise, random from the valid options
+        Returns the planned weather for the tick containing `now`.
+        The plan already enforces the Blooming streak and Brightening rain
+        spacing rules, and survives restarts because it is persisted.
         """
-        from storage import get_last_weather
-        last_weather = get_last_weather()
-
-        if season == "The Blooming":
-            # If last weather was rain/storm, increment streak
-            if last_weather in ("rain", "storm"):
-                self.blooming_streak += 1
-            else:
-                self.blooming_streak = 0
-
-            # If we've had 2 consecutive rain/storm, pick something else
-            if self.blooming_streak >= 2:
-                safe = [w for w in options if w not in ("rain", "storm")]
-                if safe:
-                    return random.choice(safe)
-
-        elif season == "The Brightening":
-            # If we rained <6 hours ago, remove 'rain' from the list
-            if self.last_rain_time:
-                six_hours_ago = now - datetime.timedelta(hours=6)
-                if self.last_rain_time > six_hours_ago:
-                    safe = [w for w in options if w != "rain"]
-                    return random.choice(safe)
-
-            # If we didn't remove 'rain', there's a 25% chance to choose it
-            if "rain" in options and random.random() < 0.25:
-                self.last_rain_time = now
-                return "rain"
-            else:
-                # Otherwise exclude rain for this cycle
-                safe = [w for w in options if w != "rain"]
-                return random.choice(safe)
-
-        # Default random pick
-        return random.choice(options)
+        return planned_weather_at(current_weather_plan(season_info), now)
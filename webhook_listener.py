@@ -1,9 +1,16 @@
 import os
 import asyncio
+import collections
 import json
+import time
+import uuid
 from aiohttp import web
-from rcon import send_rcon_command
+import metrics
+from config import WEBHOOK_ASYNC_JOBS, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+from rcon import send_rcon_batch, rcon_available, rcon_stats, servers, DEFAULT_SERVER, INTERACTIVE
 from logger import log_to_discord
+from ratelimit import CommandLimiter, ALLOWED, DUPLICATE, RATE_LIMITED
+from storage import record_command
 
 # Example dictionary of teleports:
 TELEPORT_LOCATIONS = {
@@ -18,14 +25,162 @@ TELEPORT_LOCATIONS = {
     "valkov":      {"x":9456, "y":1344, "z":8024},
 }
 
-async def run_webhook_listener(bot):
+JOB_HISTORY_SIZE = 500  # finished jobs kept for /jobs/<id> and latency stats
+
+class CommandFailed(Exception):
+    """
+    Raised by execute_command_plan when any of the plan's RCON commands
+    got no response, so the player's command may not have happened.
+    """
+
+class CommandPlan:
+    """
+    Everything an accepted in-game command will do, worked out before
+    any RCON traffic: the RCON commands to send (in order), the line for
+    #bot-logs and the reply for the player. `server` is the game server
+    the command came from; None means the default server.
     """
-    Starts an aiohttp server on port 8080 to receive messages from your game server.
-    Expects JSON body { 'username': '...', 'message': '...' }.
+    def __init__(self, name, rcon_commands, log_message, reply, server=None):
+        self.name = name
+        self.rcon_commands = rcon_commands
+        self.log_message = log_message
+        self.reply = reply
+        self.server = server
+
+class CommandJobQueue:
+    """
+    Bounded queue of accepted in-game commands, drained by a fixed pool of
+    worker tasks. The webhook handler only enqueues, so a slow game server
+    never holds up the HTTP reply to the game.
+    """
+    def __init__(self, bot, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE):
+        self.bot = bot
+        self.worker_count = workers
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._workers = []
+        self._jobs = collections.OrderedDict()
+        self._latencies = collections.deque(maxlen=JOB_HISTORY_SIZE)
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        for _ in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def submit(self, username, plan, on_success=None, on_failure=None):
+        """
+        Queues a plan and returns its job id, or None if the queue is full.
+        `on_success` or `on_failure` is called when the job finishes.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "username": username,
+            "server": plan.server or DEFAULT_SERVER,
+            "command": plan.name,
+            "status": "queued",
+            "queued_at": time.monotonic(),
+        }
+        try:
+            self._queue.put_nowait((job, plan, on_success, on_failure))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return None
+        self._remember(job)
+        return job_id
+
+    def _remember(self, job):
+        self._jobs[job["id"]] = job
+        while len(self._jobs) > JOB_HISTORY_SIZE:
+            self._jobs.popitem(last=False)
+
+    def get_job(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return {k: v for k, v in job.items() if not k.endswith("_at")}
+
+    async def _worker(self):
+        while True:
+            job, plan, on_success, on_failure = await self._queue.get()
+            self.in_flight += 1
+            job["status"] = "running"
+            started = time.monotonic()
+            try:
+                job["reply"] = await execute_command_plan(self.bot, plan)
+                job["status"] = "done"
+                self.completed += 1
+                if on_success is not None:
+                    on_success()
+            except CommandFailed as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                self.failed += 1
+                if on_failure is not None:
+                    on_failure()
+            except Exception as e:
+                print(f"[Webhook Listener] Job {job['id']} ({plan.name}) failed: {e}")
+                job["status"] = "failed"
+                self.failed += 1
+                if on_failure is not None:
+                    on_failure()
+            finally:
+                finished = time.monotonic()
+                job["wait_ms"] = round((started - job["queued_at"]) * 1000, 1)
+                job["latency_ms"] = round((finished - job["queued_at"]) * 1000, 1)
+                self._latencies.append(finished - job["queued_at"])
+                metrics.JOB_SECONDS.observe(finished - job["queued_at"])
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "workers": self.worker_count,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency_ms_p50": metrics.percentile_ms(self._latencies, 0.50),
+            "latency_ms_p99": metrics.percentile_ms(self._latencies, 0.99),
+        }
+
+def create_webhook_app(bot, async_jobs=WEBHOOK_ASYNC_JOBS):
+    """
+    Builds the aiohttp app that receives messages from your game servers.
+    Expects JSON body { 'username': '...', 'message': '...' }, plus the
+    server id as ?server=<id> or a 'server' field when there are several.
     If you want a different format, edit handle_webhook() accordingly.
+
+    With async_jobs, accepted commands are queued and the reply is just a
+    job id; GET /jobs shows queue depth and latency, GET /jobs/<id> a job.
+    Every command passes the CommandLimiter first; GET /ratelimit shows
+    how many were coalesced or rejected. While a server's RCON circuit
+    breaker is open its commands are answered with 503 at once; GET /rcon
+    shows each server's breaker and per-priority dispatcher queues.
     """
+    job_queue = CommandJobQueue(bot) if async_jobs else None
+    limiter = CommandLimiter()
 
     async def handle_webhook(request):
+        start = time.perf_counter()
+        response = await dispatch_webhook(request)
+        metrics.WEBHOOK_SECONDS.observe(time.perf_counter() - start, outcome=response.status)
+        return response
+
+    async def dispatch_webhook(request):
         try:
             data = await request.json()
         except json.decoder.JSONDecodeError:
@@ -37,27 +192,162 @@ async def run_webhook_listener(bot):
             # Not a bot command
             return web.json_response({"status": "ignored"})
 
-        # Process the command
-        reply = await process_in_game_command(bot, username, message)
-        return web.json_response({"status": "ok", "reply": reply})
+        # Each game server's webhook names itself with ?server=<id> or a
+        # "server" field; without either the command is for the default server
+        server_id = request.query.get("server") or data.get("server") or DEFAULT_SERVER
+        if server_id not in servers:
+            return web.json_response({"error": f"Unknown server '{server_id}'"}, status=400)
+
+        plan = parse_in_game_command(username, message)
+        if not isinstance(plan, CommandPlan):
+            # Usage errors and refusals are answered without touching RCON
+            metrics.INGAME_COMMANDS.inc(command="invalid", outcome="refused")
+            return web.json_response({"status": "ok", "reply": plan})
+        plan.server = server_id
 
-    # Create the aiohttp app and route
+        if not rcon_available(server_id):
+            # Fail fast instead of queuing work that can only time out
+            metrics.INGAME_COMMANDS.inc(command=plan.name, outcome="unavailable")
+            record_command(server_id, username, plan.name, "unavailable")
+            return web.json_response(
+                {"status": "unavailable", "reply": "The server can't take commands right now, try again later."},
+                status=503)
+
+        # The same name on two servers is two different players
+        limit_key = f"{server_id}:{username}"
+        verdict = limiter.check(limit_key, message)
+        if verdict != ALLOWED:
+            metrics.INGAME_COMMANDS.inc(command=plan.name, outcome=verdict)
+            record_command(server_id, username, plan.name, verdict)
+        if verdict == DUPLICATE:
+            return web.json_response({"status": "duplicate", "reply": "Already done, give it a moment."})
+        if verdict == RATE_LIMITED:
+            return web.json_response({"status": "rate_limited", "reply": "Slow down! Try again shortly."}, status=429)
+
+        # The outcome is recorded once the command has run (or not)
+        def ran():
+            metrics.INGAME_COMMANDS.inc(command=plan.name, outcome=ALLOWED)
+            record_command(server_id, username, plan.name, ALLOWED)
+
+        def not_run(outcome):
+            # Nothing happened in game: don't count it against the player
+            limiter.release(limit_key, message)
+            metrics.INGAME_COMMANDS.inc(command=plan.name, outcome=outcome)
+            record_command(server_id, username, plan.name, outcome)
+
+        if job_queue is None:
+            try:
+                reply = await execute_command_plan(bot, plan)
+            except CommandFailed:
+                not_run("failed")
+                return web.json_response(
+                    {"status": "failed", "reply": "The server didn't answer, try again."}, status=503)
+            ran()
+            return web.json_response({"status": "ok", "reply": reply})
+
+        job_id = job_queue.submit(username, plan, on_success=ran, on_failure=lambda: not_run("failed"))
+        if job_id is None:
+            not_run("busy")
+            return web.json_response({"status": "busy", "error": "Command queue is full"}, status=503)
+        return web.json_response({"status": "queued", "job_id": job_id}, status=202)
+
+    async def handle_metrics(request):
+        return web.Response(
+            body=metrics.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def handle_limit_stats(request):
+        return web.json_response(limiter.stats())
+
+    async def handle_rcon_stats(request):
+        return web.json_response(rcon_stats())
+
+    async def handle_job_stats(request):
+        return web.json_response(job_queue.stats())
+
+    async def handle_job(request):
+        job = job_queue.get_job(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"error": "Unknown job"}, status=404)
+        return web.json_response(job)
+
+    async def start_jobs(app):
+        job_queue.start()
+
+    async def stop_jobs(app):
+        await job_queue.stop()
+
+    # Create the aiohttp app and routes
     app = web.Application()
     app.router.add_post("/", handle_webhook)
+    app.router.add_get("/ratelimit", handle_limit_stats)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/rcon", handle_rcon_stats)
+    app["limiter"] = limiter
+    if job_queue is not None:
+        app["job_queue"] = job_queue
+        metrics.JOB_QUEUE_DEPTH.set_callback(job_queue.depth)
+        app.router.add_get("/jobs", handle_job_stats)
+        app.router.add_get("/jobs/{job_id}", handle_job)
+        app.on_startup.append(start_jobs)
+        app.on_cleanup.append(stop_jobs)
+    return app
+
+_runner = None
 
-    # Start the server on port 8080 (or use PORT from environment)
-    runner = web.AppRunner(app)
+async def run_webhook_listener(bot):
+    """
+    Starts the webhook app on port 8080 (or PORT from the environment).
+    Only the first call starts it; later ones return the running app's runner.
+    """
+    global _runner
+    if _runner is not None:
+        return _runner
+    runner = web.AppRunner(create_webhook_app(bot))
     await runner.setup()
     port = int(os.getenv("PORT", 8080))
     site = web.TCPSite(runner, host="0.0.0.0", port=port)
-    await site.start()
+    try:
+        await site.start()
+    except OSError:
+        await runner.cleanup()
+        raise
+    _runner = runner
     print(f"[Webhook Listener] Listening on port {port}")
+    return runner
 
 async def process_in_game_command(bot, username: str, message: str):
     """
     Parses the in-game command like '!redisland' or '!freezehealth',
     sends RCON commands, and logs as needed.
     """
+    plan = parse_in_game_command(username, message)
+    if not isinstance(plan, CommandPlan):
+        return plan
+    return await execute_command_plan(bot, plan)
+
+async def execute_command_plan(bot, plan: CommandPlan):
+    """
+    Sends the plan's RCON commands as one ordered batch to the plan's
+    server and logs it. Raises CommandFailed if any command got no
+    response (send_rcon_batch reports those as None).
+    """
+    results = await send_rcon_batch(plan.rcon_commands, priority=INTERACTIVE, server=plan.server)
+    failed = sum(1 for result in results if result is None or isinstance(result, Exception))
+    prefix = f"[{plan.server or DEFAULT_SERVER}] " if len(servers) > 1 else ""
+    if failed:
+        await log_to_discord(bot, f"{prefix}FAILED: {plan.log_message} ({failed}/{len(results)} RCON commands got no response)")
+        raise CommandFailed(f"{failed}/{len(results)} RCON commands failed")
+    await log_to_discord(bot, f"{prefix}{plan.log_message}")
+    return plan.reply
+
+def parse_in_game_command(username: str, message: str):
+    """
+    Works out what an in-game command should do without running it.
+    Returns a CommandPlan, or a reply string when the command is unknown,
+    malformed or not allowed.
+    """
     # Convert everything to lowercase for matching, but keep original for messages
     cmd = message.lower().split()
 
@@ -67,24 +357,30 @@ async def process_in_game_command(bot, username: str, message: str):
         if base_cmd in TELEPORT_LOCATIONS:
             coords = TELEPORT_LOCATIONS[base_cmd]
             rcon_command = f"/teleport x={coords['x']} y={coords['y']} z={coords['z']}"
-            await send_rcon_command(rcon_command)
-            await send_rcon_command(f"/systemmessage Teleporting {username} to {base_cmd}")
-            await log_to_discord(bot, f"{username} teleported to {base_cmd}")
-            return f"Teleported to {base_cmd}"
+            return CommandPlan(
+                base_cmd,
+                [rcon_command, f"/systemmessage Teleporting {username} to {base_cmd}"],
+                f"{username} teleported to {base_cmd}",
+                f"Teleported to {base_cmd}",
+            )
 
     # FREEZE HEALTH: !freezehealth -> /setattr HealthRecoveryRate 0
     if cmd[0] == "!freezehealth":
-        await send_rcon_command("/setattr HealthRecoveryRate 0")
-        await send_rcon_command(f"/systemmessage Health regen frozen for {username}")
-        await log_to_discord(bot, f"{username} used freezehealth")
-        return "Health regeneration frozen."
+        return CommandPlan(
+            "freezehealth",
+            ["/setattr HealthRecoveryRate 0", f"/systemmessage Health regen frozen for {username}"],
+            f"{username} used freezehealth",
+            "Health regeneration frozen.",
+        )
 
     # FREEZE STAMINA: !freezestam -> /setattr StaminaRecoveryRate 0
     if cmd[0] == "!freezestam":
-        await send_rcon_command("/setattr StaminaRecoveryRate 0")
-        await send_rcon_command(f"/systemmessage Stamina regen frozen for {username}")
-        await log_to_discord(bot, f"{username} used freezestam")
-        return "Stamina regeneration frozen."
+        return CommandPlan(
+            "freezestam",
+            ["/setattr StaminaRecoveryRate 0", f"/systemmessage Stamina regen frozen for {username}"],
+            f"{username} used freezestam",
+            "Stamina regeneration frozen.",
+        )
 
     # SET GROWTH: !setgrowth 0.7 -> /setattr growth 0.7 then /setattra GrowthPerSecond 0
     if cmd[0] == "!setgrowth":
@@ -95,11 +391,16 @@ async def process_in_game_command(bot, username: str, message: str):
         except ValueError:
             return "Invalid growth value. Must be a float between 0.0 and 1.0"
         if 0.0 <= growth_val <= 1.0:
-            await send_rcon_command(f"/setattr growth {growth_val}")
-            await send_rcon_command("/setattra GrowthPerSecond 0")
-            await send_rcon_command(f"/systemmessage Growth set to {growth_val} for {username}")
-            await log_to_discord(bot, f"{username} used setgrowth {growth_val}")
-            return f"Growth set to {growth_val} and frozen."
+            return CommandPlan(
+                "setgrowth",
+                [
+                    f"/setattr growth {growth_val}",
+                    "/setattra GrowthPerSecond 0",
+                    f"/systemmessage Growth set to {growth_val} for {username}",
+                ],
+                f"{username} used setgrowth {growth_val}",
+                f"Growth set to {growth_val} and frozen.",
+            )
         else:
             return "Growth must be between 0.0 and 1.0"
 
@@ -110,9 +411,12 @@ async def process_in_game_command(bot, username: str, message: str):
         is_admin = (username.lower() in ["youradminusername"])  # example
         if not is_admin:
             return "You are not allowed to use this admin command."
-        await send_rcon_command(f"/systemmessage PING from {username}")
-        await log_to_discord(bot, f"{username} used !pingme")
-        return "Pong! (admin verified)"
+        return CommandPlan(
+            "pingme",
+            [f"/systemmessage PING from {username}"],
+            f"{username} used !pingme",
+            "Pong! (admin verified)",
+        )
 
     # If we reach here, none of the commands matched
     return "Command not recognized."